@@ -1,37 +1,99 @@
 import sys
 import os
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 #import pymeshlab as ml
-  
+
+def parseArguments(argv):
+    if "--" in argv:
+        argv = argv[argv.index("--") + 1:] # get all args after "--"
+    else:
+        argv = argv[1:]
+    parser = argparse.ArgumentParser(description="Compresses every OBJ in a folder with corto, one output<i>.crt per OBJ in name order")
+    parser.add_argument("inputPath", help="folder with the OBJ files")
+    parser.add_argument("outputPath", help="folder for the CRT files")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="number of corto processes to run at once, defaults to one per CPU")
+    parser.add_argument("--corto", default="./corto", help="path to the corto binary")
+    parser.add_argument("--force", action="store_true", help="convert meshes again even if their CRT file already exists")
+    return parser.parse_args(argv)
+
+def convertMesh(corto, url, newUrl):
+    # corto writes to a temporary file that is renamed once it succeeded, so an interrupted run never leaves a
+    # truncated CRT file that a later run would skip. Returns (return code, corto output)
+    tempUrl = newUrl[:-len(".crt")] + ".part.crt"
+    try:
+        result = subprocess.run([corto, url, "-o", tempUrl], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as error:
+        return -1, str(error)
+    if result.returncode == 0 and not os.path.exists(tempUrl):
+        return -1, "corto did not write " + tempUrl
+    if result.returncode == 0:
+        os.replace(tempUrl, newUrl)
+    elif os.path.exists(tempUrl):
+        os.remove(tempUrl)
+    return result.returncode, result.stdout.decode(errors="replace")
+
 def main():
-    argv = sys.argv
-    argv = argv[argv.index("--") + 1:] # get all args after "--"
+    args = parseArguments(sys.argv)
 
-    inputPath = argv[0] 
-    outputPath = argv[1] 
+    inputPath = args.inputPath
+    outputPath = args.outputPath
+    corto = os.path.abspath(args.corto) if os.path.sep in args.corto else args.corto
 
     urls = []
 
     for fileName in os.listdir(inputPath):
-        fileName = fileName.lower()
-        if fileName.endswith("obj"): 
+        if fileName.lower().endswith("obj"):
             url = os.path.abspath(os.path.join(inputPath, fileName))
             urls.append(url)
     urls.sort()
 
-    for i in range(0, len(urls)):  
-        print("\nLoading meshes " + str(i+1) + " / " + str(len(urls)))
-       
-        '''
-        ms = ml.MeshSet()
-        ms.load_new_mesh(urls[i])
-        mesh = ms.current_mesh()
-        '''
+    os.makedirs(outputPath, exist_ok=True)
+    tasks = []
+    skipped = 0
+    for i in range(0, len(urls)):
+        newUrl = os.path.abspath(os.path.join(outputPath, "output" + str(i) + ".crt"))
+        if not args.force and os.path.exists(newUrl) and os.path.getsize(newUrl) > 0:
+            skipped += 1
+            continue
+        tasks.append((i, urls[i], newUrl))
+    if skipped:
+        print("Skipping " + str(skipped) + " meshes that are already converted")
+    if not tasks:
+        print("Nothing to convert")
+        return
 
-        newUrl = os.path.abspath(os.path.join(outputPath,"output" + str(i) + ".crt"))
-        
-        #ms.save_current_mesh(newUrl)
+    start = time.time()
+    failures = []
+    inputBytes = 0
+    outputBytes = 0
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = [executor.submit(convertMesh, corto, url, newUrl) for i, url, newUrl in tasks]
+        for (i, url, newUrl), future in zip(tasks, futures):
+            returnCode, output = future.result()
+            done += 1
+            if returnCode != 0:
+                failures.append((i, url, returnCode, output))
+                print("Failed mesh " + str(i+1) + " / " + str(len(urls)) + ": " + url + " (exit code " + str(returnCode) + ")")
+                continue
+            inputBytes += os.path.getsize(url)
+            outputBytes += os.path.getsize(newUrl)
+            print("Converted mesh " + str(i+1) + " / " + str(len(urls)) + " (" + str(done) + " of " + str(len(tasks)) + " this run)")
+    seconds = max(time.time() - start, 1e-9)
 
-        os.system("./corto " + urls[i] + " -o " + newUrl)
+    converted = len(tasks) - len(failures)
+    print("\nConverted " + str(converted) + " meshes in " + "%.1f" % seconds + " sec with " + str(args.jobs) + " jobs: "
+          + "%.1f" % (converted / seconds) + " meshes per sec, " + "%.1f" % (inputBytes / seconds / 1e6) + " MB of OBJ per sec")
+    if outputBytes:
+        print("OBJ " + "%.1f" % (inputBytes / 1e6) + " MB -> CRT " + "%.1f" % (outputBytes / 1e6) + " MB (" + "%.1f" % (inputBytes / outputBytes) + "x)")
+    if failures:
+        for i, url, returnCode, output in failures[:10]:
+            print("\n" + url + " (exit code " + str(returnCode) + "):\n" + output.strip())
+        print("\n" + str(len(failures)) + " meshes failed to convert")
+        sys.exit(1)
 
 main()
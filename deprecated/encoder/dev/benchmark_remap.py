@@ -0,0 +1,81 @@
+"""
+Times the remap stage of decimate_mesh on a 100k vertex poly mesh: building
+the output vertex and face arrays of a decimated mesh from the input columns.
+
+The per element version does what decimate_mesh used to do (a Face object per
+triangle, and every field of every output vertex assigned on its own) for all
+vertices. The vectorized version is encoder.remap_decimated. The decimation
+itself is not timed: a random 25% of the vertices are kept, since the cost of
+the remap only depends on the sizes.
+
+Usage: python benchmark_remap.py [vertex count]
+"""
+import sys
+import time
+
+import numpy as np
+
+import encoder
+import pyprogmesh
+
+
+class Face:
+    v_1 = 0
+    v_2 = 0
+    v_3 = 0
+
+
+def remap_per_element(vertex_data, plan):
+    outFaces = []
+    for triangle in plan.Faces.tolist():
+        t = Face()
+        t.v_1 = triangle[0]
+        t.v_2 = triangle[1]
+        t.v_3 = triangle[2]
+        outFaces.append(t)
+
+    output_vertices = np.empty(len(plan.Indices), dtype=vertex_data.dtype)
+    for i in range(len(plan.Indices)):
+        old_index = plan.Indices[i]
+        for name in vertex_data.dtype.names:
+            output_vertices[i][name] = vertex_data[name][old_index].astype('f4')
+
+    output_faces = np.empty([len(outFaces)], dtype=[('vertex_indices', 'i4', (3,))])
+    for i in range(0, len(outFaces)):
+        face = np.empty(3, dtype=np.int32)
+        face[0] = outFaces[i].v_1
+        face[1] = outFaces[i].v_2
+        face[2] = outFaces[i].v_3
+        output_faces['vertex_indices'][i] = face
+    return output_vertices, output_faces
+
+
+def main():
+    vertex_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random = np.random.RandomState(0)
+
+    # Poly mesh with positions, UVs and degree 4 polynomial coefficients
+    vertex_data = np.empty(vertex_count, dtype=encoder._full_data_type)
+    for name in vertex_data.dtype.names:
+        vertex_data[name] = random.rand(vertex_count)
+
+    kept = np.sort(random.choice(vertex_count, vertex_count // 4, replace=False))
+    faces = random.randint(0, len(kept), (len(kept) * 2, 3))
+    plan = pyprogmesh.CollapsePlan(kept, faces, vertex_count)
+
+    start = time.perf_counter()
+    slow_vertices, slow_faces = remap_per_element(vertex_data, plan)
+    slow_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast_vertices, fast_faces = encoder.remap_decimated(vertex_data, plan)
+    fast_seconds = time.perf_counter() - start
+
+    assert np.array_equal(slow_vertices, fast_vertices) and np.array_equal(slow_faces, fast_faces)
+    print("%d vertices -> %d vertices, %d faces" % (vertex_count, len(kept), len(faces)))
+    print("per element: %.3f sec" % slow_seconds)
+    print("vectorized:  %.4f sec (%.0fx)" % (fast_seconds, slow_seconds / fast_seconds))
+
+
+if __name__ == '__main__':
+    main()
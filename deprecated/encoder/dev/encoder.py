@@ -2,25 +2,35 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import os
+import re
 import copy
-from plyfile import PlyData, PlyElement
+from plyfile import PlyData, PlyElement, PlyParseError
 import json
+from concurrent.futures import ProcessPoolExecutor
 from numpy.lib.recfunctions import merge_arrays
 import pyprogmesh
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-import warnings
-warnings.simplefilter('ignore', np.RankWarning)
 
 dirname = os.path.dirname(__file__)
 
 decimation_amount = .25 # Decimation percentage
+use_quadrics = False # Quadric error metric decimation, False for the original curvature heuristic
+decimate_frames = False # Also write every frame of a group to decimated/frames, decimated with the collapse order of its first frame
+frame_lod_ratios = [.5, .25, .1] # Levels of detail written for every frame when decimate_frames is set
+adaptive_fit = False # Split groups into sub-keyframes and use the lowest polynomial degree that stays within max_fit_error
+max_fit_error = 0.001 # Largest distance between a fitted and an original vertex coordinate, in mesh units
+max_polynomial_degree = 4 # Highest polynomial degree used by adaptive_fit
+frame_rate = 30 # Frames per second of the sequence, for the fit report
+binary_ply = True # Write binary little-endian PLY files, False for ASCII
+jobs = None # Worker processes encoding topology groups in parallel, None for one per CPU
 
-_current_keyframe = 0
 # If a mesh doesn't have multiple corresponding frames to make a fit from, don't encode additional vertex data
 _short_data_type = [('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('texture_u', '<f4'), ('texture_v', '<f4')]
 # If a mesh has multiple coherent frames, encode additional vertex data
 _full_data_type = [('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('texture_u', '<f4'), ('texture_v', '<f4'), ('x0', '<f4'), ('x1', '<f4'), ('x2', '<f4'), ('x3', '<f4'), ('y0', '<f4'), ('y1', '<f4'), ('y2', '<f4'), ('y3', '<f4'), ('z0', '<f4'), ('z1', '<f4'), ('z2', '<f4'), ('z3', '<f4')]
+# Module settings handed to the worker processes, so they also apply where workers don't fork from main()
+_worker_settings = ['dirname', 'decimation_amount', 'use_quadrics', 'decimate_frames', 'frame_lod_ratios', 'adaptive_fit', 'max_fit_error', 'max_polynomial_degree', 'binary_ply']
 
 
 #======================================================================================================================
@@ -28,365 +38,427 @@ _full_data_type = [('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('texture_u', '<f4'
 #======================================================================================================================
 
 def main():
-    frame_number = 0
-    vertex_count_in_last_ply = 0
-    meshes_in_group = []
-
     Data_Path = dirname + "/output_ply_face_uvs"
     # Data_Path = dirname + "/encode"
 
     # Exception Handling : If 'encode' folder is not there, create one
     assert os.path.exists(Data_Path), 'The Dataset Folder not found. Please consider giving full(absolute) file path.'
 
-    for files in os.listdir(Data_Path):
-        if files.endswith(".ply"): # Exception Handling
+    # Find the group boundaries first, from the PLY headers only
+    groups = scan_groups(Data_Path)
+    print("Found " + str(len(groups)) + " group(s) in " + str(sum(len(paths) for keyframe, paths in groups)) + " frames")
+
+    # Create the output folders before the workers write into them
+    make_output_folder("encoded")
+    make_output_folder("decimated")
+    if(decimate_frames == True):
+        make_output_folder("decimated/frames")
+
+    write_fit_report(encode_groups(groups))
+
+#======================================================================================================================
+
+
+def scan_groups(data_path):
+    # Splits the frames into groups of consecutive frames with the same vertex count.
+    # Returns (keyframe, paths) for every group, the keyframe being the frame number of its first frame
+    groups = []
+    vertex_count_in_last_ply = None
+    for frame_number, path in enumerate(frame_paths(data_path)):
+        vertex_count = read_vertex_count(path)
+        if (vertex_count != vertex_count_in_last_ply):
+            print("New Shape at Frame " + str(frame_number))
+            groups.append((frame_number, []))
+        groups[-1][1].append(path)
+        vertex_count_in_last_ply = vertex_count # set new vertex count
+    return groups
+
+#======================================================================================================================
+
+
+def encode_groups(groups):
+    # Encodes every group in a pool of worker processes and returns their fit reports in frame order.
+    # The longest groups are started first so that a long group doesn't end up running alone at the end
+    if(jobs == 1):
+        return [report for keyframe, paths in groups for report in encode_group(keyframe, paths)]
+    settings = dict((name, globals()[name]) for name in _worker_settings)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=apply_settings, initargs=(settings,)) as executor:
+        futures = [(keyframe, executor.submit(encode_group, keyframe, paths)) for keyframe, paths in sorted(groups, key=lambda group: len(group[1]), reverse=True)]
+        reports = [(keyframe, future.result()) for keyframe, future in futures]
+    return [report for keyframe, group_reports in sorted(reports, key=lambda item: item[0]) for report in group_reports]
+
+#======================================================================================================================
+
+
+def apply_settings(settings):
+    globals().update(settings)
+
+#======================================================================================================================
+
+
+def encode_group(keyframe, paths):
+    # Only this group's frames are in memory. Returns a fit report per run of frames with the same triangles
+    meshes = [read_ply(path) for path in paths]
+    reports = []
+    for first, count in split_by_triangles(meshes):
+        if(first > 0):
+            print("New Triangles at Frame " + str(keyframe + first))
+        print("Encoding " + str(count) + " frame(s) at frame " + str(keyframe + first))
+        reports.append(create_poly_mesh_from_sequence(meshes[first:first + count], keyframe + first))
+    return reports
+
+#======================================================================================================================
+
+
+def split_by_triangles(meshes):
+    # scan_groups only compares vertex counts, but the frames of a group share a collapse order and vertex trajectories,
+    # which needs the same triangles too. Splits the group wherever they change, as (first frame, frame count) runs
+    runs = []
+    previous = None
+    for i in range(len(meshes)):
+        triangles = pyprogmesh.ArrayMesh.PlyTriangles(meshes[i])
+        if(previous is None or np.array_equal(triangles, previous) == False):
+            runs.append([i, 0])
+        runs[-1][1] += 1
+        previous = triangles
+    return [tuple(run) for run in runs]
+
+#======================================================================================================================
+
+
+def make_output_folder(name):
+    # Exception handling
+    if(os.path.exists(dirname + "/" + name) == False):
+        print('The "' + name + '" folder not found. Creating a new one..', end = '')
+        os.makedirs(dirname + "/" + name, exist_ok=True)
+        print('Done')
+
+#======================================================================================================================
+
 
-            mesh = PlyData.read(Data_Path + '/' + files)
-            print(len(mesh['vertex']['x']))
-            
-            if (frame_number > 0 and len(mesh['vertex']['x']) != vertex_count_in_last_ply):
-                print("New Shape at Frame " + str(frame_number))
-                create_poly_mesh_from_sequence(meshes_in_group)
-                meshes_in_group = [mesh]
+def frame_paths(data_path):
+    # PLY files of the directory in frame order, comparing the numbers in their names as numbers (frame_9 < frame_10)
+    def natural_key(name):
+        return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+    return [data_path + '/' + name for name in sorted(os.listdir(data_path), key=natural_key) if name.endswith(".ply")]
+
+#======================================================================================================================
+
+
+def read_ply(path):
+    # Triangle lists are read as fixed size arrays, which lets plyfile memory-map binary files instead of parsing every face
+    try:
+        return PlyData.read(path, known_list_len={'face': {'vertex_indices': 3, 'vertex_index': 3}})
+    except PlyParseError:
+        return PlyData.read(path)
+
+#======================================================================================================================
+
+
+def read_vertex_count(path):
+    # Number of vertices of a PLY file, from its header
+    with open(path, 'rb') as f:
+        for line in f:
+            words = line.split()
+            if(words[:2] == [b'element', b'vertex']):
+                return int(words[2])
+            if(words[:1] == [b'end_header']):
+                break
+    raise ValueError(path + ': no vertex element in the PLY header')
+
+#======================================================================================================================
+
+
+def write_ply(path, elements):
+    PlyData(elements, text=(binary_ply != True), byte_order='<').write(path)
+
+#======================================================================================================================
+
+
+def fit_trajectories(positions, degree=4):
+    # positions is a (frames, vertices, 3) array. Every vertex trajectory is fit against the frame number at once,
+    # like np.polyfit would fit each of them: one Vandermonde matrix, with its columns scaled for conditioning, and a single
+    # least squares solve for all (frames, vertices * 3) values. Returns (degree + 1, vertices, 3) coefficients, highest power first
+    frame_count = positions.shape[0]
+    frames = np.arange(frame_count, dtype=np.float64)
+    vandermonde = np.vander(frames, degree + 1)
+    scale = np.sqrt((vandermonde * vandermonde).sum(axis=0))
+    scale[scale == 0] = 1
+    coefficients = np.linalg.lstsq(vandermonde / scale, positions.reshape(frame_count, -1), rcond=frame_count * np.finfo(np.float64).eps)[0]
+    coefficients = (coefficients.T / scale).T
+    return coefficients.reshape(degree + 1, positions.shape[1], 3)
+
+#======================================================================================================================
+
+
+def poly_data_type(degree):
+    # Vertex data with `degree` polynomial terms per axis, highest power first: x0 * t^degree + ... + x{degree-1} * t
+    if(degree == 0):
+        return _short_data_type
+    return _short_data_type + [(axis + str(n), '<f4') for axis in ['x', 'y', 'z'] for n in range(degree)]
+
+#======================================================================================================================
+
+
+def trajectory_error(offsets, coefficients):
+    # Largest distance, on any axis, between the offsets and the trajectories the player reconstructs from the
+    # coefficients as they are written: in float32, and without the constant term
+    degree = coefficients.shape[0] - 1
+    if(degree == 0):
+        return float(np.abs(offsets).max())
+    frame_count = offsets.shape[0]
+    vandermonde = np.vander(np.arange(frame_count, dtype=np.float64), degree + 1)[:, :-1]
+    stored = coefficients[:-1].astype('f4').astype(np.float64).reshape(degree, -1)
+    reconstructed = vandermonde.dot(stored).reshape(offsets.shape)
+    return float(np.abs(reconstructed - offsets).max())
+
+#======================================================================================================================
+
+
+def fit_segment(offsets, max_degree):
+    # Fits the lowest degree that stays within max_fit_error, or max_degree if none does.
+    # Returns (degree, coefficients, error)
+    for degree in range(max_degree + 1):
+        if(degree == 0):
+            coefficients = np.zeros((1,) + offsets.shape[1:])
+        else:
+            coefficients = fit_trajectories(offsets, degree)
+        error = trajectory_error(offsets, coefficients)
+        if(error <= max_fit_error):
+            break
+    return degree, coefficients, error
+
+#======================================================================================================================
+
+
+def split_trajectories(positions, max_degree):
+    # Splits (frames, vertices, 3) positions into sub-keyframes: each one is as long as a max_degree fit of its
+    # trajectories (relative to its own first frame) stays within max_fit_error, found with a doubling and binary search.
+    # Returns a list of (first frame, frame count)
+    def fits(first, count):
+        offsets = positions[first:first + count] - positions[first]
+        return trajectory_error(offsets, fit_trajectories(offsets, max_degree)) <= max_fit_error
+
+    segments = []
+    first = 0
+    frame_count = positions.shape[0]
+    while first < frame_count:
+        # Up to max_degree + 1 frames always fit exactly
+        good = min(max_degree + 1, frame_count - first)
+        bad = None
+        while bad is None and good < frame_count - first:
+            count = min(good * 2, frame_count - first)
+            if fits(first, count):
+                good = count
+            else:
+                bad = count
+        while bad is not None and bad - good > 1:
+            count = (good + bad) // 2
+            if fits(first, count):
+                good = count
             else:
-                meshes_in_group.append(mesh)
-                print("Adding mesh " +  str(frame_number+1) + " to group")
+                bad = count
+        segments.append((first, good))
+        first = first + good
+    return segments
+
+#======================================================================================================================
 
-            frame_number = frame_number + 1
-            _current_keyframe = frame_number
-            vertex_count_in_last_ply = len(mesh['vertex']['x']) # set new vertex count
 
-    create_poly_mesh_from_sequence(meshes_in_group)
+def encoded_size(vertex_count, face_count, degree):
+    # Bytes of vertex and face data in a binary PLY, each face being a uchar count and 3 int indices
+    return vertex_count * np.dtype(poly_data_type(degree)).itemsize + face_count * 13
 
 #======================================================================================================================
 
 
-def create_poly_mesh_from_sequence(meshes):
+def create_poly_mesh_from_sequence(meshes, keyframe):
     # Is it a sequence of meshes or a single mesh? Skip the fit algorithm for single meshes
     is_sequence = len(meshes) > 1
     # Count the number of 'x' entries in the first mesh, assuming all meshes have the same count and xyz are the same
     number_of_vertices = len(meshes[0]['vertex']['x'])
+    number_of_faces = meshes[0]['face'].count
+
+    # One collapse order for the whole group: the decimated keyframe and every level of detail are taken from the
+    # same replay, so they keep the vertex correspondence between frames
+    lod_ratios = frame_lod_ratios if decimate_frames == True else []
+    plans = compute_collapse_plans(meshes[0], [decimation_amount] + lod_ratios)
 
-    # Input vertices from first frame
-    input_vertices = meshes[0].elements[0]
-    # Input faces from first frame
-    input_faces = meshes[0].elements[1]
+    if(decimate_frames == True):
+        decimate_group(meshes, plans[1:], lod_ratios, keyframe)
 
-    encoded_vertices_transposed = []
+    # (frames, vertices, 3) positions
+    positions = np.empty((len(meshes), number_of_vertices, 3), dtype=np.float64)
+    for m in range(len(meshes)):
+        for a, axis in enumerate(['x', 'y', 'z']):
+            positions[m, :, a] = meshes[m]['vertex'][axis][:number_of_vertices]
 
+    # Sub-keyframes as (first frame, frame count, degree, coefficients, error)
+    segments = []
+    if(is_sequence == True):
+        # Offset so the first mesh is always 0 vals
+        offsets = positions - positions[0]
+        coefficients = fit_trajectories(offsets, 4)
+        degree_4_error = trajectory_error(offsets, coefficients)
+        if(adaptive_fit == True):
+            for first, count in split_trajectories(positions, max_polynomial_degree):
+                segments.append((first, count) + fit_segment(positions[first:first + count] - positions[first], max_polynomial_degree))
+        else:
+            segments.append((0, len(meshes), 4, coefficients, degree_4_error))
+    else:
+        segments.append((0, 1, 0, None, 0.0))
+
+    # Sub-keyframes are decimated with the group's plan rather than one computed on their own first frame, so they keep
+    # the vertex correspondence of the group and no segment pays for another decimation
+    for first, count, degree, coefficients, error in segments:
+        write_poly_mesh(meshes[first], degree, coefficients, keyframe + first, plans[0])
+
+    # Size/error tradeoff, against a single degree 4 fit of the whole group
+    report = {
+        'keyframe': keyframe,
+        'frames': len(meshes),
+        'vertices': number_of_vertices,
+        'segments': [{'first_frame': keyframe + first, 'frames': count, 'degree': degree, 'max_error': error, 'bytes': int(encoded_size(number_of_vertices, number_of_faces, degree))} for first, count, degree, coefficients, error in segments],
+    }
+    report['bytes'] = sum(segment['bytes'] for segment in report['segments'])
+    report['max_error'] = max(segment['max_error'] for segment in report['segments'])
     if(is_sequence == True):
-        for mesh in range(len(meshes)):
-            for v in ['x', 'y', 'z']:
-                for vert in range(min(len(meshes[mesh].elements[0].data[v]), len(meshes[0].elements[0].data[v]))):
-                    # offset meshes so first mesh is always 0 vals
-                    meshes[mesh].elements[0].data[v][vert] = meshes[mesh].elements[0].data[v][vert] - meshes[0].elements[0].data[v][vert]
-            # For all meshes in group, subtract position from self and add to offset mesh group
-
-        # Array of polynomial data we will append to vertices later
-        polynomial_array = []
-
-        # for each vert in our meshes...
-        for current_vertex in range(number_of_vertices):
-            # print("\nNew Vertex\n")
-            # get an axis
-            polyAxes = []
-            # for each in xyz
-            for axis in ['x', 'y', 'z']:
-                # new array of vertex positions
-                vertex_positions = []
-                # Frame list encodes a single integer for each mesh in the sequence, to give polyfit a second dimension
-                frame_list = []
-                # Will be incremented with each frame processed and add to frame list
-                current_frame = 0
-                # for each mesh in count
-                for m in range(len(meshes)):
-                    # Add the mesh number, with the first mesh in this sequence being 0
-                    frame_list.append(current_frame)
-                    # Increment the current frame
-                    current_frame = current_frame + 1
-                    # add the normalized 
-                    # vertex_positions.append(meshes[m]['vertex'][axis][current_vertex] - meshes[0]['vertex'][axis][current_vertex])
-                    vertex_positions.append(meshes[m]['vertex'][axis][current_vertex])
-                # model = polyfit
-                # print('\nFrames List :', frame_list, '\nVertex Positions :', vertex_positions)
-                model = np.polyfit(frame_list, vertex_positions, 4)
-                # Add the model data. We are removing the last term, which will always be 0 on a normalized trajectory
-                polyAxes.append( model[:-1] )
-            # append the output to our array of outputs, polynomial_array[v] corresponds with meshes[0]['vertex'][axis][v]
-            polynomial_array.append(polyAxes)
-
-        # Make a new list to hold our encoded vertices
-        encoded_vertices = []
-
-        # Convert the polynomial array to a numpy format we can reason and combine with original vertex data
-        # This could probably be greatly simplified, since we are trying to make an x, y and z array into a single array of xyz
-        # for each vertex in the polynomial array
-        for v in range(len(polynomial_array)):
-            # New encoded vertex, with polynomials stored for xyz
-            encoded_vertex = []
-            # Append all vertex data for this vertex
-            for val in input_vertices[v]:
-                encoded_vertex.append(val)
-            # Traverse xyz axes in this vertex
-            for a in range(len(polynomial_array[v])):
-                # Traverse polynomial terms
-                for n in range(len(polynomial_array[v][a])):
-                    # Append polynomial terms to the vertex in XYZ order
-                    encoded_vertex.append(polynomial_array[v][a][n])
-            # Convert list to np array and add to list of encoded vertices
-            encoded_vertices.append(np.array(encoded_vertex))
-        #Transpose encoded vertices so rows are columns and we are writing rows
-        encoded_vertices_transposed = np.array(encoded_vertices).T
+        report['degree_4_bytes'] = int(encoded_size(number_of_vertices, number_of_faces, 4))
+        report['degree_4_max_error'] = degree_4_error
+    print("Group at frame " + str(keyframe) + ": " + str(len(segments)) + " keyframe(s), " + str(report['bytes']) + " bytes, max error " + str(report['max_error']))
+    return report
+
+#======================================================================================================================
+
+
+def write_poly_mesh(mesh, degree, coefficients, keyframe, plan):
+    number_of_vertices = len(mesh['vertex']['x'])
 
     # Create an array for our final vertices
-    vertices = np.empty(number_of_vertices, dtype=(_short_data_type if is_sequence != True else _full_data_type))
+    vertices = np.empty(number_of_vertices, dtype=poly_data_type(degree))
 
     # Populate with original data
-    vertices['x'] = meshes[0]['vertex']['x'].astype('f4')
-    vertices['y'] = meshes[0]['vertex']['y'].astype('f4')
-    vertices['z'] = meshes[0]['vertex']['z'].astype('f4')
-    vertices['texture_u'] = meshes[0]['vertex']['texture_u'].astype('f4')
-    vertices['texture_v'] = meshes[0]['vertex']['texture_v'].astype('f4')
+    vertices['x'] = mesh['vertex']['x'].astype('f4')
+    vertices['y'] = mesh['vertex']['y'].astype('f4')
+    vertices['z'] = mesh['vertex']['z'].astype('f4')
+    vertices['texture_u'] = mesh['vertex']['texture_u'].astype('f4')
+    vertices['texture_v'] = mesh['vertex']['texture_v'].astype('f4')
 
-    # If this mesh is a sequence, write the data into our vertices array
-    if(is_sequence == True):
-        vertices['x0'] = encoded_vertices_transposed[5].astype('f4')
-        vertices['x1'] = encoded_vertices_transposed[6].astype('f4')
-        vertices['x2'] = encoded_vertices_transposed[7].astype('f4')
-        vertices['x3'] = encoded_vertices_transposed[8].astype('f4')
-        vertices['y0'] = encoded_vertices_transposed[9].astype('f4')
-        vertices['y1'] = encoded_vertices_transposed[10].astype('f4')
-        vertices['y2'] = encoded_vertices_transposed[11].astype('f4')
-        vertices['y3'] = encoded_vertices_transposed[12].astype('f4')
-        vertices['z0'] = encoded_vertices_transposed[13].astype('f4')
-        vertices['z1'] = encoded_vertices_transposed[14].astype('f4')
-        vertices['z2'] = encoded_vertices_transposed[15].astype('f4')
-        vertices['z3'] = encoded_vertices_transposed[16].astype('f4')
+    # Write the polynomials into our vertices array. We are removing the last term, which will always be 0 on a normalized trajectory
+    for a, axis in enumerate(['x', 'y', 'z']):
+        for n in range(degree):
+            vertices[axis + str(n)] = coefficients[n, :, a]
 
-    # Exception handling
-    if(os.path.exists(dirname + "/encoded") == False):
-        print('The "encoded" folder not found. Creating a new one..', end = '')
-        os.mkdir(dirname + "/encoded"); print('Done')
+    make_output_folder("encoded")
 
     # Write the py file
-    poly_mesh_path = (dirname + "/encoded/" + str(_current_keyframe) + '.ply')
-    ply = PlyData([PlyElement.describe(vertices, 'vertex'), input_faces], text=True)
-    ply.write(poly_mesh_path)
+    poly_mesh_path = (dirname + "/encoded/" + str(keyframe) + '.ply')
+    ply = PlyData([PlyElement.describe(vertices, 'vertex'), mesh['face']])
+    write_ply(poly_mesh_path, ply.elements)
 
-    # Chain the decimation on to the end
-    decimate_mesh(poly_mesh_path, decimation_amount, is_sequence)
+    # Chain the decimation on to the end, with the mesh still in memory
+    decimate_mesh(ply, plan, os.path.basename(poly_mesh_path))
 
 #======================================================================================================================
 
 
-def decimate_mesh(poly_mesh_path, decimate_amount, is_sequence):
+def write_fit_report(groups):
+    # Totals over all groups, with the bytes per second of motion
+    frames = sum(group['frames'] for group in groups)
+    total_bytes = sum(group['bytes'] for group in groups)
+    degree_4_bytes = sum(group.get('degree_4_bytes', group['bytes']) for group in groups)
+    seconds = frames / float(frame_rate)
+    report = {
+        'adaptive_fit': adaptive_fit,
+        'max_fit_error': max_fit_error,
+        'max_polynomial_degree': max_polynomial_degree,
+        'frames': frames,
+        'keyframes': sum(len(group['segments']) for group in groups),
+        'bytes': total_bytes,
+        'bytes_per_second': total_bytes / seconds if seconds else None,
+        'max_error': max([group['max_error'] for group in groups] or [0.0]),
+        'degree_4_bytes': degree_4_bytes,
+        'degree_4_bytes_per_second': degree_4_bytes / seconds if seconds else None,
+        'degree_4_max_error': max([group.get('degree_4_max_error', group['max_error']) for group in groups] or [0.0]),
+        'groups': groups,
+    }
+    make_output_folder("encoded")
+    with open(dirname + "/encoded/fit_report.json", 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Fit report: " + str(report['keyframes']) + " keyframe(s), " + str(report['bytes_per_second']) + " bytes per second, max error " + str(report['max_error']))
 
-    # Empty objects
-    new_verts = list()
-    faces = list()
+#======================================================================================================================
 
-    # Create a new mesh object
-    decimatedMesh = Mesh()
 
+def progressive_mesh_settings():
     # Progressive Mesh decimation settings
     PMSettings = pyprogmesh.ProgMeshSettings()
     PMSettings.ProtectTexture = True
     PMSettings.RemoveDuplicate = False
     PMSettings.KeepBorder = True
+    PMSettings.UseQuadrics = use_quadrics
+    return PMSettings
+
+#======================================================================================================================
 
-    # Read mesh from path
-    mesh = PlyData.read(poly_mesh_path)
-    # print(mesh['vertex']['x'])
- 
-
-    # Get number of vertices in mesh
-    number_of_vertices = len(mesh['vertex']['x']) #14
-    # Get x, y and z data in mesh
-    (x, y, z) = (mesh['vertex'][t] for t in ('x', 'y', 'z'))
-
-    # Extract vertices from x, y and z columns into a single xyz column and append to decimated mesh
-    for i in range(number_of_vertices):
-        vertex = Vertex() # 'Vertex' class object
-        vertex.x = x[i]
-        vertex.y = y[i]
-        vertex.z = z[i]
-        decimatedMesh.vertices.append(vertex) # append vertex object
-
-
-    for i in range(number_of_vertices): # 14
-        v = [decimatedMesh.vertices[i].x, decimatedMesh.vertices[i].y, decimatedMesh.vertices[i].z]
-        _uv = [mesh['vertex']['texture_u'][i], mesh['vertex']['texture_v'][i]]
-        # print('\nUV :', _uv, '\n')
-        # if mesh.has_normals:
-        #     _normal = [mesh.normals[i].x, mesh.normals[i].y, mesh.normals[i].z]
-        # else:
-        _normal = None 
-        new_verts.append(pyprogmesh.RawVertex(Position=v, UV=_uv, Normal=_normal, RGBA=None))
-    #HANDLE FACES
-
-    # For each in vertex indicies
-    # Create a new face
-    # populate with v_1, v_2, v_3
-    # append to face list
-    decimatedMesh.faces = []
-    for i in range(0, mesh.elements[1].count):
-        face = Face()
-        face.v_1 = mesh['face'].data['vertex_indices'][i][0]
-        face.v_2 = mesh['face'].data['vertex_indices'][i][1]
-        face.v_3 = mesh['face'].data['vertex_indices'][i][2]
-        # Append to decimated mesh face count
-        decimatedMesh.faces.append(face)
-
-    # Rename values and add to faces list
-    # Probably could combine this with our decimated mesh faces
-    for i in range(0, mesh.elements[1].count):
-        faces.append([decimatedMesh.faces[i].v_1, decimatedMesh.faces[i].v_2, decimatedMesh.faces[i].v_3])
-
-    # Create a new progressive mesh object
-    pm = pyprogmesh.ProgMesh(len(new_verts), len(faces), new_verts, faces, PMSettings)
-    # Compute the mesh decimate
+
+def compute_collapse_plans(mesh, ratios):
+    # All meshes in a group share the triangles of the first one, so the collapse order is computed once, on the
+    # first mesh, and replayed once for all the ratios, from the most to the least detailed.
+    # Returns a CollapsePlan per ratio, None where the collapse didn't work
+    arrayMesh = pyprogmesh.ArrayMesh.FromPly(mesh)
+    pm = pyprogmesh.ProgMesh(arrayMesh, settings=progressive_mesh_settings())
     pm.ComputeProgressiveMesh()
-    # Perform decimation and return mesh data
-    result = pm.DoProgressiveMesh(decimate_amount)
-    # If result is 0 then the collapse didn't work, and code past this point will fail
-    if(result == 0):
-        print("*** Error collapsing mesh")
-        return
-    
-    decimatedMesh.num_vertices, decimatedMesh.vertices, decimatedMesh.num_faces, decimatedMesh.faces, decimatedMesh.collapse_map = result[0], result[1], result[2], result[3], result[4]
-    
-    # Some empty lists to hold data
-    output_vertices = []
-    newUVs = []
-    newNormals = []
-
-    # For each vertex, pull out the information and rename the variables
-    for i in range(0, decimatedMesh.num_vertices):
-        rawVert = new_verts[i]
-        v = Vertex()
-        v.x = rawVert.Position[0]
-        v.y = rawVert.Position[1]
-        v.z = rawVert.Position[2]
-        # Not sure if we need this
-        # if decimatedMesh.num_uv_sets > 0:
-        #     uv = decimatedMesh.uv_sets[0][i]
-        #     uv.u = rawVert.UV[0]
-        #     uv.v = rawVert.UV[1]
-        #     newUVs.append(uv)
-        # if decimatedMesh.has_normals:
-        #     normals = decimatedMesh.normals[i]
-        #     normals.x = rawVert.Normal[0]
-        #     normals.y = rawVert.Normal[1]
-        #     normals.z = rawVert.Normal[2]
-        #     newNormals.append(normals)
-        # Append the vertex to our list
-        output_vertices.append(v)
-    # Set vertices, so not we have xyz instead of a position[] array
-    decimatedMesh.vertices = output_vertices
-    # These are blank for now but will need to be handled
-    decimatedMesh.normals = newNormals
-    decimatedMesh.uv_sets = newUVs
-
-    # Same thing for the faces -- restructure with new names
-    outFaces = []
-    # For each face, rename and reassign
-    # This might be something we can remove completely
-    for i in range(0, decimatedMesh.num_faces):
-        triangle = decimatedMesh.faces[i]
-        t = Face()
-        t.v_1 = triangle[0]
-        t.v_2 = triangle[1]
-        t.v_3 = triangle[2]
-        outFaces.append(t)
-    
-    # Set decimated mesh faces to newly structured faces
-    decimatedMesh.faces = outFaces
-
-    # Make a new empty container for our final output vertices
-    output_vertices = np.empty(len(decimatedMesh.vertices), dtype=(_short_data_type if is_sequence != True else _full_data_type))
-
-    # Hold the length of the decimated mesh
-    decimated_mesh_length = len(decimatedMesh.vertices)
-
-    # Fill vertex values with their original values, albeit truncated
-    output_vertices['x'] = mesh['vertex']['x'][0:decimated_mesh_length].astype('f4')
-    output_vertices['y'] = mesh['vertex']['y'][0:decimated_mesh_length].astype('f4')
-    output_vertices['z'] = mesh['vertex']['z'][0:decimated_mesh_length].astype('f4')
-
-    print("**** COLLAPSE MAP VALUE")
-    print(decimatedMesh.collapse_map)
-    # Now iterate through and fill them with the proper values
-    # for i in range(0, len(decimatedMesh.collapse_map)):
-    for i in range(3):
-        # Look up old index
-        # Since we don't have the new index, this is almost certain wrong, unless collapse map is the same value
-        old_index = decimatedMesh.collapse_map[i]
-        if(old_index == -1):
-            old_index = i
-        output_vertices[i]['x'] = mesh['vertex']['x'][old_index].astype('f4')
-        output_vertices[i]['y'] = mesh['vertex']['y'][old_index].astype('f4')
-        output_vertices[i]['z'] = mesh['vertex']['z'][old_index].astype('f4')
-        output_vertices['texture_u'] = mesh['vertex']['texture_u'][old_index].astype('f4')
-        output_vertices['texture_v'] = mesh['vertex']['texture_v'][old_index].astype('f4')   
-        # Add additional vertex data if it's a sequence
-        if(is_sequence):
-            output_vertices[i]['x0'] = mesh['vertex']['x0'][old_index].astype('f4')
-            output_vertices[i]['x1'] = mesh['vertex']['x1'][old_index].astype('f4')
-            output_vertices[i]['x2'] = mesh['vertex']['x2'][old_index].astype('f4')
-            output_vertices[i]['y0'] = mesh['vertex']['y0'][old_index].astype('f4')
-            output_vertices[i]['y1'] = mesh['vertex']['y1'][old_index].astype('f4')
-            output_vertices[i]['y2'] = mesh['vertex']['y2'][old_index].astype('f4')
-            output_vertices[i]['z0'] = mesh['vertex']['z0'][old_index].astype('f4')
-            output_vertices[i]['z1'] = mesh['vertex']['z1'][old_index].astype('f4')
-            output_vertices[i]['z2'] = mesh['vertex']['z3'][old_index].astype('f4')
-
-
-    # New empty array for faces, to be added back to final PLY
-    output_faces = np.empty([len(decimatedMesh.faces)], dtype=[('vertex_indices', 'i4', (3,))])
-
-    # For each face, translate decimated mesh back to a sane format
-    for i in range(0, len(decimatedMesh.faces)):
-        face = np.empty(3, dtype=np.int32)
-        face[0] = decimatedMesh.faces[i].v_1
-        face[1] = decimatedMesh.faces[i].v_2
-        face[2] = decimatedMesh.faces[i].v_2
-        output_faces['vertex_indices'][i] = face
+    return pm.ComputeCollapsePlans(ratios)
 
+#======================================================================================================================
 
-    # Exception handling
-    if(os.path.exists(dirname + "/decimated") == False):
-        print('The "decimated" folder not found. Creating a new one..', end = '')
-        os.mkdir(dirname + "/decimated")
-        print('Done')
 
-    # Set the write path    
-    poly_mesh_path = dirname + '/decimated/poly' + str(_current_keyframe) + '.ply'
-    # Create ply and write it
-    ply = PlyData([PlyElement.describe(output_vertices, 'vertex'), PlyElement.describe(output_faces, 'face')], text=True)
-    ply.write(poly_mesh_path)
+def decimate_group(meshes, plans, lod_ratios, keyframe):
+    # Every frame is decimated with the plans of the group, so every frame keeps the same vertices in the same order
+    make_output_folder("decimated/frames")
+
+    for level in range(len(plans)):
+        plan = plans[level]
+        # If plan is None then the collapse didn't work for this level
+        if(plan is None):
+            print("*** Error collapsing mesh to " + str(lod_ratios[level]))
+            continue
+
+        for i in range(len(meshes)):
+            output_vertices, output_faces = remap_decimated(meshes[i]['vertex'].data, plan)
+            frame_path = dirname + '/decimated/frames/' + str(keyframe) + '_' + str(i) + '_lod' + str(level + 1) + '.ply'
+            write_ply(frame_path, [PlyElement.describe(output_vertices, 'vertex'), PlyElement.describe(output_faces, 'face')])
+
+#======================================================================================================================
+
+
+def remap_decimated(vertex_data, plan):
+    # Output vertices and faces of a decimated mesh. plan.Indices holds the input index of every output vertex,
+    # so one gather pulls all the vertex columns (positions, UVs and polynomial coefficients) at once
+    output_vertices = plan.Gather(vertex_data)
+    output_faces = np.empty([len(plan.Faces)], dtype=[('vertex_indices', 'i4', (3,))])
+    output_faces['vertex_indices'] = np.asarray(plan.Faces, dtype=np.int32)
+    return output_vertices, output_faces
 
 #======================================================================================================================
 
-class Mesh:
-    vertices = []
-    has_normals = False
-    num_uv_sets = 0
-    normals = []
-    faces = []
-    num_faces = []
-    uv_sets = []
-    collapse_map = []
-
-class Vertex:
-    x = 0
-    y = 0
-    z = 0
-
-class Face:
-    v_1 = 0
-    v_2 = 0
-    v_3 = 0
 
+def decimate_mesh(mesh, plan, output_name):
+    # plan is the group's CollapsePlan for decimation_amount.
+    # If plan is None then the collapse didn't work, and code past this point will fail
+    if(plan is None):
+        print("*** Error collapsing mesh")
+        return
+
+    output_vertices, output_faces = remap_decimated(mesh['vertex'].data, plan)
+
+    make_output_folder("decimated")
+
+    # Set the write path    
+    poly_mesh_path = dirname + '/decimated/poly' + output_name
+    # Create ply and write it
+    write_ply(poly_mesh_path, [PlyElement.describe(output_vertices, 'vertex'), PlyElement.describe(output_faces, 'face')])
 
 #======================================================================================================================
 
@@ -7,8 +7,11 @@ from pyffi.utils.mathutils import vecNormalized
 from pyffi.utils.mathutils import vecNorm 
 
 from collections import defaultdict
+import heapq
 import time
 
+import numpy as np
+
 class CollapseItem:
     old_index = 0
     new_index = 0
@@ -21,6 +24,12 @@ class ProgMeshSettings:
         self.ProtectColor = False
         self.KeepBorder = True
         self.RemoveDuplicate = False
+        # Garland-Heckbert quadric error metric instead of the curvature heuristic
+        self.UseQuadrics = False
+        # weight of the planes that keep border edges in place
+        self.QuadricBorderWeight = 100.0
+        # penalty for UV distance, relative to the squared bounding box diagonal
+        self.QuadricUVWeight = 0.01
 
 class RawTriangle:
 ##    v1 = None
@@ -50,6 +59,65 @@ class RawVertex:
         if UV != None:
             self.UV = UV
 
+class ArrayMesh:
+    """
+    Array backed mesh: per vertex attributes are NumPy arrays and triangles
+    an (F, 3) int32 array, read from a PLY a whole column at a time.
+    ProgMesh keeps the triangles in this array instead of RawTriangle
+    objects.
+    """
+    def __init__(self, positions, triangles, uvs=None, normals=None, colors=None):
+        self.Positions = np.ascontiguousarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.Triangles = np.ascontiguousarray(triangles, dtype=np.int32).reshape(-1, 3)
+        self.UVs = None if uvs is None else np.ascontiguousarray(uvs, dtype=np.float64).reshape(-1, 2)
+        self.Normals = None if normals is None else np.ascontiguousarray(normals, dtype=np.float64).reshape(-1, 3)
+        self.Colors = None if colors is None else np.ascontiguousarray(colors).reshape(-1, 4)
+        self.VertexCount = len(self.Positions)
+        self.FaceCount = len(self.Triangles)
+        if self.FaceCount and (self.Triangles.min() < 0 or self.Triangles.max() >= self.VertexCount):
+            raise ValueError("ArrayMesh: triangle vertex index out of range")
+    @classmethod
+    def FromPly(cls, ply):
+        """
+        Builds an ArrayMesh from a plyfile.PlyData with 'vertex' and 'face'
+        elements, reading whole columns at once.
+        """
+        vertex = ply['vertex'].data
+        names = vertex.dtype.names
+        positions = np.column_stack([vertex['x'], vertex['y'], vertex['z']])
+        uvs = None
+        for u, v in (('texture_u', 'texture_v'), ('u', 'v'), ('s', 't')):
+            if u in names and v in names:
+                uvs = np.column_stack([vertex[u], vertex[v]])
+                break
+        normals = None
+        if 'nx' in names:
+            normals = np.column_stack([vertex['nx'], vertex['ny'], vertex['nz']])
+        colors = None
+        if 'red' in names:
+            alpha = vertex['alpha'] if 'alpha' in names else np.full(len(vertex), 255)
+            colors = np.column_stack([vertex['red'], vertex['green'], vertex['blue'], alpha])
+        return cls(positions, cls.PlyTriangles(ply), uvs=uvs, normals=normals, colors=colors)
+    @staticmethod
+    def PlyTriangles(ply):
+        """
+        The (F, 3) triangles of the 'face' element of a plyfile.PlyData,
+        without building a mesh, eg: to check that frames share them.
+        """
+        face = ply['face'].data
+        indices = face['vertex_indices'] if 'vertex_indices' in face.dtype.names else face['vertex_index']
+        if indices.dtype == object:
+            # list properties of a mixed or text PLY come as an object array
+            return np.array(indices.tolist(), dtype=np.int32).reshape(-1, 3)
+        return np.asarray(indices).reshape(-1, 3)
+    def RawVertices(self):
+        # RawVertex objects for ProgMesh, built from whole columns
+        positions = self.Positions.tolist()
+        uvs = self.UVs.tolist() if self.UVs is not None else [None] * self.VertexCount
+        normals = self.Normals.tolist() if self.Normals is not None else [None] * self.VertexCount
+        colors = self.Colors.tolist() if self.Colors is not None else [None] * self.VertexCount
+        return [RawVertex(Position=p, Normal=n, RGBA=c, UV=uv) for p, uv, n, c in zip(positions, uvs, normals, colors)]
+
 def SortByBorderAndCost(u, v):
     if u.IsBorder() and not v.IsBorder():
         return -1
@@ -91,6 +159,8 @@ class CollapseVertex:
     def __init__(self, _parent, _ID, _use_cost=False):
         self.parent = _parent
         self.ID = _ID
+        # index into the raw vertices, kept when ID is re-numbered
+        self.Index = _ID
         self.use_cost = _use_cost
         self.Vert = _parent.GetRawVert(self.ID)
         self.Cost = -1.0
@@ -100,6 +170,7 @@ class CollapseVertex:
         self.Neighbors = list()
         self.Faces = list()
         self.n_costs = defaultdict(list)
+        self.Quadric = None
         return
     def RemoveSelf(self):
         if len(self.Faces) != 0:
@@ -227,22 +298,25 @@ class CollapseVertex:
         return (self.ID == v.ID and self.parent == v.parent)
     def __lt__(self, v):
         return (self.Cost > v.Cost)
-    def ComputeCost(self, v):
-        edgelength = 1.0
-        if self.parent.Settings.UseEdgelength:
-            length = vecSub(v.Vert.Position, self.Vert.Position)
-            edgelength = vecNorm(length)
+    def HasSameNeighbors(self, v):
         if (len(self.Neighbors) == len(v.Neighbors)):
-            same_neighbors = True
             for neighbor in self.Neighbors:
                 if neighbor == v:
                     continue
                 if not v.IsNeighbor(neighbor):
-                    same_neighbors = False
-                    break
-            if same_neighbors:
-#                input("ERROR: ComputeCost() same neighbors detected.")
-                return 999999.9
+                    return False
+            return True
+        return False
+    def ComputeCost(self, v):
+        if self.parent.Settings.UseQuadrics:
+            return self.ComputeQuadricCost(v)
+        edgelength = 1.0
+        if self.parent.Settings.UseEdgelength:
+            length = vecSub(v.Vert.Position, self.Vert.Position)
+            edgelength = vecNorm(length)
+        if self.HasSameNeighbors(v):
+#            input("ERROR: ComputeCost() same neighbors detected.")
+            return 999999.9
         curvature = 0.001
         sides = list()
         for f in self.Faces:
@@ -268,6 +342,28 @@ class CollapseVertex:
         cost = edgelength * curvature
 #        print ("DEBUG: ComputeCost() v[%d] to v[%d], c=%f" % (self.ID, v.ID, cost))
         return cost
+    def ComputeQuadricCost(self, v):
+        # Error of moving this vertex onto v: the summed squared distances of
+        # v's position to the planes in both quadrics, plus the UV penalty.
+        # ProgMesh.ComputeAllQuadricCollapseCosts() is the batched version.
+        if self.HasSameNeighbors(v):
+            return 999999.9
+        if self.parent.Settings.KeepBorder and self.IsBorder():
+            return 999999.9
+        p = v.Vert.Position
+        q = (self.Quadric + v.Quadric).dot([p[0], p[1], p[2], 1.0])
+        cost = q[0]*p[0] + q[1]*p[1] + q[2]*p[2] + q[3]
+        if self.parent.Settings.ProtectTexture:
+            du = self.Vert.UV[0] - v.Vert.UV[0]
+            dv = self.Vert.UV[1] - v.Vert.UV[1]
+            cost = cost + self.parent.UVPenaltyScale * (du*du + dv*dv)
+        return max(float(cost), 0.0)
+    def RecomputeCosts(self):
+        self.n_costs.clear()
+        self.Cost = -1.0
+        self.Candidate = None
+        for n in self.Neighbors:
+            self.AddCost(self.ComputeCost(n), n)
     def ComputeNormal(self):
         if len(self.Faces) == 0:
             return
@@ -362,12 +458,86 @@ class CollapseTriangle:
         return
 
 
+##########################################################
+#
+# CollapseQueue
+#
+##########################################################
+class CollapseQueue:
+    """
+    Priority queue of the vertices left to collapse.
+
+    ComputeProgressiveMesh used to re-sort the whole vertex list by Cost after
+    every collapse and pick the last vertex. This queue picks the same vertex:
+    each vertex is keyed by the Cost it had at the last sort and its rank in
+    that sort, so ties are broken the way the stable sort broke them. After a
+    collapse, only the vertices around it are re-keyed (Resort), and outdated
+    heap entries are skipped when popped.
+    """
+    def __init__(self, sorted_vertices):
+        # sorted_vertices: sorted by Cost, highest first, like ProgMesh.vertices
+        self.keys = dict()
+        self.heap = list()
+        self.dirty = dict()
+        for rank in range(0, len(sorted_vertices)):
+            v = sorted_vertices[rank]
+            self.keys[v.ID] = (v.Cost, rank)
+            self.heap.append((v.Cost, -rank, v.ID))
+        heapq.heapify(self.heap)
+        # ranks for vertices moved to the front/back of the vertices with equal cost
+        self.front_rank = -1
+        self.back_rank = len(sorted_vertices)
+    def __len__(self):
+        return len(self.keys)
+    def Pop(self):
+        # returns the ID of the vertex that would be last in the sorted list
+        while True:
+            cost, negative_rank, ID = heapq.heappop(self.heap)
+            if self.keys.get(ID) == (cost, -negative_rank):
+                del self.keys[ID]
+                return ID
+    def Touch(self, vertices):
+        # remembers vertices whose Cost may have changed since the last sort
+        for v in vertices:
+            if v is not None and v.ID in self.keys:
+                self.dirty[v.ID] = v
+    def Resort(self):
+        # Emulates a stable sort by Cost (highest first) of the remaining list.
+        # A vertex whose cost dropped was ahead of every vertex that has its new
+        # cost, so it moves to the front of them. A vertex whose cost rose moves
+        # to the back. Moved vertices keep their previous order among themselves.
+        dropped = list()
+        risen = list()
+        for ID, v in self.dirty.items():
+            cost, rank = self.keys[ID]
+            if v.Cost < cost:
+                dropped.append((cost, rank, v))
+            elif v.Cost > cost:
+                risen.append((cost, rank, v))
+        self.dirty.clear()
+        dropped.sort(key=lambda item: (item[0], -item[1]))
+        for cost, rank, v in dropped:
+            self.Rekey(v, self.front_rank)
+            self.front_rank = self.front_rank - 1
+        risen.sort(key=lambda item: (-item[0], item[1]))
+        for cost, rank, v in risen:
+            self.Rekey(v, self.back_rank)
+            self.back_rank = self.back_rank + 1
+    def Rekey(self, v, rank):
+        self.keys[v.ID] = (v.Cost, rank)
+        heapq.heappush(self.heap, (v.Cost, -rank, v.ID))
+
 ##########################################################
 #
 # ProgMesh
 #
 ##########################################################
 class ProgMesh:
+    """
+    While ComputeProgressiveMesh and DoProgressiveMesh run, the live vertices
+    and triangles are tracked in dictionaries (so removing one is O(1)) and
+    self.vertices / self.triangles are refreshed when they return.
+    """
 ##    Settings = ProgMeshSettings()
 ##    vertices = list()
 ##    triangles = list()
@@ -377,18 +547,31 @@ class ProgMesh:
 ##    RawTriangleCount = 0
 ##    RawTriangles = list()
 ##    RawVerts = list()
-    def __init__(self, vertCount, faceCount, verts, faces, settings=None):
+    def __init__(self, vertCount, faceCount=None, verts=None, faces=None, settings=None):
+        # An ArrayMesh can be passed instead of the counts and lists:
+        # ProgMesh(mesh, settings=settings)
         if isinstance(settings, ProgMeshSettings):
             self.Settings = settings
         else:
             self.Settings = ProgMeshSettings()
+        self.Mesh = None
         self.vertices = list()
         self.triangles = list()
+        self.VertexMap = dict()
+        self.TriangleMap = dict()
         self.CollapseOrder = list()
         self.CollapseMap = dict()
+        self.UVPenaltyScale = 0.0
         self.RawTriangles = list()
         self.RawVerts = list()
         t = time.time()
+        if isinstance(vertCount, ArrayMesh):
+            # triangles stay in the mesh's index array, see GetTriangleIndices()
+            self.Mesh = vertCount
+            self.RawVertexCount = self.Mesh.VertexCount
+            self.RawTriangleCount = self.Mesh.FaceCount
+            self.RawVerts = self.Mesh.RawVertices()
+            return
         self.RawVertexCount = vertCount
         self.RawTriangleCount = faceCount
 #        print ("DEBUG: ProgMesh.init(): vertCount=%d, faceCount=%d, num verts=%d, num faces=%d" % (vertCount, faceCount, len(verts), len(faces)))
@@ -408,30 +591,44 @@ class ProgMesh:
 #            print ("DEBUG: Face: [%d, %d, %d]" % (f[0], f[1], f[2]))
 #        print ("PROFILING: completed in %f sec" % (time.time() - t))
         return
+    def TrackVerticesAndTriangles(self):
+        # vertex IDs are unique once ComputeProgressiveMesh/DoProgressiveMesh re-indexed them
+        self.VertexMap = dict((v.ID, v) for v in self.vertices)
+        self.TriangleMap = dict((id(t), t) for t in self.triangles)
+    def UpdateVerticesAndTriangles(self):
+        self.vertices = list(self.VertexMap.values())
+        self.triangles = list(self.TriangleMap.values())
     def HasVertex(self, v):
-        if v in self.vertices:
+        u = self.VertexMap.get(v.ID)
+        if u is not None and u == v:
             return True
         return False
     def RemoveVertex(self, v):
         if self.HasVertex(v):
             # print ("  DEBUG: RemoveVertex(): ID=%d" % (v.ID))
-            self.vertices.remove(v)
+            del self.VertexMap[v.ID]
             v.RemoveSelf()
             del v
         return
     def HasTriangle(self, t):
-        if t in self.triangles:
+        if id(t) in self.TriangleMap:
             return True
         return False
     def RemoveTriangle(self, t):
         if self.HasTriangle(t):
 #            print ("  DEBUG: RemoveTriangle(): [%d %d %d]" % (t.vertex[0].ID, t.vertex[1].ID, t.vertex[2].ID))
-            self.triangles.remove(t)
+            del self.TriangleMap[id(t)]
             t.RemoveSelf()
             del t
         return
     def GetRawTriangle(self, index):
+        if self.Mesh is not None:
+            return RawTriangle(self.Mesh.Triangles[index].tolist())
         return self.RawTriangles[index]
+    def GetTriangleIndices(self):
+        if self.Mesh is not None:
+            return self.Mesh.Triangles.tolist()
+        return [[t.v1, t.v2, t.v3] for t in self.RawTriangles]
     def GetRawVert(self, index):
         return self.RawVerts[index]
     def CheckDuplicate(self, v):
@@ -461,11 +658,109 @@ class ProgMesh:
             cost = v.ComputeCost(neighbor)
             v.AddCost(cost, neighbor)
         return
+    def ComputeQuadrics(self):
+        """
+        Sets the Garland-Heckbert quadric of every vertex, in batch: each face
+        adds the quadric of its plane to its three vertices, and each border
+        edge adds a plane perpendicular to its face, weighted by
+        Settings.QuadricBorderWeight, to its two vertices. Returns the (V, 16)
+        quadrics, the positions and the UVs as arrays indexed by vertex ID.
+        """
+        count = len(self.vertices)
+        positions = np.array([v.Vert.Position for v in self.vertices], dtype=np.float64).reshape(-1, 3)
+        uvs = np.array([v.Vert.UV for v in self.vertices], dtype=np.float64).reshape(-1, 2)
+        faces = np.array([[t.vertex[0].ID, t.vertex[1].ID, t.vertex[2].ID] for t in self.triangles], dtype=np.int64).reshape(-1, 3)
+
+        p0 = positions[faces[:, 0]]
+        normals = np.cross(positions[faces[:, 1]] - p0, positions[faces[:, 2]] - p0)
+        lengths = np.linalg.norm(normals, axis=1)
+        valid = lengths > 1e-12
+        normals = normals[valid] / lengths[valid, None]
+        planes = np.concatenate([normals, -(normals * p0[valid]).sum(axis=1)[:, None]], axis=1)
+        # each face adds its plane quadric to its three vertices
+        plane_vertices = [faces[valid].reshape(-1)]
+        plane_quadrics = [np.repeat(np.einsum('fi,fj->fij', planes, planes).reshape(-1, 16), 3, axis=0)]
+
+        # border edges (used by a single face) add a perpendicular plane to both ends
+        edge_starts = faces.reshape(-1)
+        edge_ends = faces[:, [1, 2, 0]].reshape(-1)
+        edge_faces = np.repeat(np.arange(len(faces)), 3)
+        keys = np.minimum(edge_starts, edge_ends) * count + np.maximum(edge_starts, edge_ends)
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        border = (counts[inverse.reshape(-1)] == 1) & (edge_starts != edge_ends) & valid[edge_faces]
+        face_normals = np.zeros((len(faces), 3))
+        face_normals[valid] = normals
+        a = edge_starts[border]
+        b = edge_ends[border]
+        side = np.cross(positions[b] - positions[a], face_normals[edge_faces[border]])
+        side_lengths = np.linalg.norm(side, axis=1)
+        keep = side_lengths > 1e-12
+        side = side[keep] / side_lengths[keep, None]
+        border_planes = np.concatenate([side, -(side * positions[a[keep]]).sum(axis=1)[:, None]], axis=1)
+        border_quadrics = self.Settings.QuadricBorderWeight * np.einsum('fi,fj->fij', border_planes, border_planes).reshape(-1, 16)
+        plane_vertices = np.concatenate(plane_vertices + [a[keep], b[keep]])
+        plane_quadrics = np.concatenate(plane_quadrics + [border_quadrics, border_quadrics])
+
+        quadrics = np.zeros((count, 16))
+        for c in range(0, 16):
+            quadrics[:, c] = np.bincount(plane_vertices, weights=plane_quadrics[:, c], minlength=count)
+        for i in range(0, count):
+            self.vertices[i].Quadric = quadrics[i].reshape(4, 4)
+
+        if count:
+            diagonal = positions.max(axis=0) - positions.min(axis=0)
+            self.UVPenaltyScale = self.Settings.QuadricUVWeight * float(np.dot(diagonal, diagonal))
+        return quadrics, positions, uvs
+    def ComputeAllQuadricCollapseCosts(self):
+        # the costs of all directed edges are evaluated at once, then handed to
+        # the vertices in neighbor order like ComputeEdgeCostAtVertex does
+        quadrics, positions, uvs = self.ComputeQuadrics()
+        sources = list()
+        targets = list()
+        for v in self.vertices:
+            for n in v.Neighbors:
+                sources.append(v.ID)
+                targets.append(n.ID)
+        sources = np.array(sources, dtype=np.int64)
+        targets = np.array(targets, dtype=np.int64)
+        points = np.concatenate([positions[targets], np.ones((len(targets), 1))], axis=1)
+        edge_quadrics = (quadrics[sources] + quadrics[targets]).reshape(-1, 4, 4)
+        costs = np.einsum('ei,eij,ej->e', points, edge_quadrics, points)
+        if self.Settings.ProtectTexture:
+            uv_distances = uvs[sources] - uvs[targets]
+            costs = costs + self.UVPenaltyScale * (uv_distances * uv_distances).sum(axis=1)
+        costs = np.maximum(costs, 0.0)
+        if self.Settings.KeepBorder:
+            border = np.array([v.IsBorder() for v in self.vertices], dtype=bool)
+            costs[border[sources]] = 999999.9
+        costs = costs.tolist()
+
+        e = 0
+        for v in self.vertices:
+            if len(v.Neighbors) == 0:
+                v.Candidate = None
+                v.Cost = -0.01
+                continue
+            for n in v.Neighbors:
+                if v.HasSameNeighbors(n):
+                    v.AddCost(999999.9, n)
+                else:
+                    v.AddCost(costs[e], n)
+                e = e + 1
+        return
+    def UpdateQuadricCosts(self, v):
+        # after collapsing onto v, its quadric changed, so every cost to or from v is stale
+        for w in [v] + v.Neighbors:
+            w.RecomputeCosts()
+        return
     def ComputeAllEdgeCollapseCosts(self):
         t1 = time.time()
 #        print ("DEBUG: ComputeAllEdgeCollapseCosts(): ...")
-        for vert in self.vertices:
-            self.ComputeEdgeCostAtVertex(vert)
+        if self.Settings.UseQuadrics:
+            self.ComputeAllQuadricCollapseCosts()
+        else:
+            for vert in self.vertices:
+                self.ComputeEdgeCostAtVertex(vert)
 #            print ("DEBUG: v[%d], Candidate=[%d], Cost=%f" % (vert.ID, vert.Candidate.ID, vert.Cost))
         self.vertices.sort(key=lambda vert: vert.Cost, reverse=True)
 #        self.vertices.sort(cmp=SortByCost)        
@@ -473,10 +768,15 @@ class ProgMesh:
         return
         
     def Collapse(self, u, v, recompute=True):
+        # Returns the vertices whose Cost may change because of this collapse
+        affected = [u] + u.Neighbors
         if v is None:
 #            print ("DEBUG: Collapse(): u.Faces #=%d, v is None" % (len(u.Faces)))
             self.RemoveVertex(u)
-            return
+            return affected
+        affected = affected + [v] + v.Neighbors
+        for f in u.Faces:
+            affected.extend(f.vertex)
 
         # INTEGRITY CHECK
         num_Faces = len(u.Faces)
@@ -524,10 +824,8 @@ class ProgMesh:
 #        print ("INSPECTION: u.Faces (#%d): %s" % (len(u.Faces), s))
 
         self.RemoveVertex(u)
-        self.vertices.sort(key=lambda vert: vert.Cost, reverse=True)
-#        self.vertices.sort(cmp=SortByCost)
 #        print ("============ COLLAPSE() completed. =====================")
-        return
+        return affected
         
     def ComputeProgressiveMesh(self):
         t1 = time.time()
@@ -548,8 +846,8 @@ class ProgMesh:
         del self.triangles[:]
         t2 = time.time()
 #        print ("DEBUG: Generating self.triangles (CollapseTriangle data), TriangleCount=%d" % (self.TriangleCount))
-        for i in range(0, self.RawTriangleCount):
-            t = CollapseTriangle(self.vertices[self.RawTriangles[i].v1], self.vertices[self.RawTriangles[i].v2], self.vertices[self.RawTriangles[i].v3])
+        for v1, v2, v3 in self.GetTriangleIndices():
+            t = CollapseTriangle(self.vertices[v1], self.vertices[v2], self.vertices[v3])
             self.triangles.append(t)
 #        print ("PROFILING: Generated self.triangles, completed in %f sec" % (time.time()-t2))
         t2 = time.time()
@@ -587,19 +885,26 @@ class ProgMesh:
             v = self.vertices[i]
             costMap.append(v.Cost)
         self.CollapseMap.clear()
-        while len(self.vertices) != 0:
-            mn = self.vertices[-1]
+        self.TrackVerticesAndTriangles()
+        queue = CollapseQueue(self.vertices)
+        while len(queue) != 0:
+            mn = self.VertexMap[queue.Pop()]
             cv = mn.Candidate
-##            # integrity check
-##            if mn.ID > len(self.vertices):
-##                print ("ERROR FOUND: mn.ID = %d at index=%d, self.vertices #=%d" % (mn.ID, self.vertices.index(mn), len(self.vertices)))
-#            print ("DEBUG: ComputeProgressiveMesh(): mn.ID = %d, i = %d" % (mn.ID, len(self.vertices)-1))
-            self.CollapseOrder[len(self.vertices)-1] = [mn.ID, costMap[len(self.vertices)-1] ]
+#            print ("DEBUG: ComputeProgressiveMesh(): mn.ID = %d, i = %d" % (mn.ID, len(queue)))
+            self.CollapseOrder[len(queue)] = [mn.ID, costMap[len(queue)] ]
             if cv != None:
                 self.CollapseMap[mn.ID] = cv.ID
             else:
                 self.CollapseMap[mn.ID] = -1
-            self.Collapse(mn, cv)
+            if self.Settings.UseQuadrics and cv != None:
+                cv.Quadric = cv.Quadric + mn.Quadric
+            queue.Touch(self.Collapse(mn, cv))
+            if self.Settings.UseQuadrics and cv != None:
+                self.UpdateQuadricCosts(cv)
+            # the vertex list used to be re-sorted after every collapse onto a candidate
+            if cv != None:
+                queue.Resort()
+        self.UpdateVerticesAndTriangles()
 ##        s = ''
 ##        for co in self.CollapseOrder:
 ##            s = s + ("v[%d](c=%f) " % (co[0], co[1]))
@@ -607,13 +912,10 @@ class ProgMesh:
 #        print ("PROFIING: Generated self.CollapseOrder, completed in %f sec" % (time.time()-t2))
         t2 = time.time()
         print(("PROFILING: ComputeProgressiveMesh(): completed in %f sec" % (t2-t1)))
-    def DoProgressiveMesh(self, ratio):
-        t1 = time.time()
-        target = self.RawVertexCount * ratio
-#        print ("DEBUG: DoProgressiveMesh(): ratio=%f, target=%f" % (ratio, target))
+    def BeginCollapseReplay(self):
+        # Rebuilds the mesh from the raw data and returns the vertices in
+        # CollapseOrder, the next one to collapse last
         CollapseList = list()
-        new_Faces = list()
-        new_Verts = list()
         del self.vertices[:]
         for i in range(0, self.RawVertexCount):
             v = CollapseVertex(self, i)
@@ -621,9 +923,8 @@ class ProgMesh:
                 v = self.CheckDuplicate(v)
             self.vertices.append(v)
         del self.triangles[:]
-        for i in range(0, self.RawTriangleCount):
-            t_ = self.RawTriangles[i]
-            t = CollapseTriangle(self.vertices[t_.v1], self.vertices[t_.v2], self.vertices[t_.v3])
+        for v1, v2, v3 in self.GetTriangleIndices():
+            t = CollapseTriangle(self.vertices[v1], self.vertices[v2], self.vertices[v3])
             self.triangles.append(t)
         i = 0
         j = 0
@@ -655,7 +956,14 @@ class ProgMesh:
 ##        for co in CollapseList:
 ##            s = s + " " + str( co.ID )              
 ##        print ("DEBUG: CollapseList (#%d): %s" % (len(CollapseList), s))
+        self.TrackVerticesAndTriangles()
+        return CollapseList
+    def ReplayCollapses(self, CollapseList, target):
+        # Collapses vertices from the end of CollapseList until at most target
+        # are left. Returns the number of collapses and whether any of them
+        # was onto a candidate (which changes the output vertex order).
         CollapseCount = 0
+        resort = False
         while len(CollapseList) > target:
             mn = CollapseList[-1]
 ##            if self.Settings.KeepBorder and mn.IsBorder():
@@ -674,7 +982,23 @@ class ProgMesh:
             CollapseCount = CollapseCount+1
             self.Collapse(mn, mn.Candidate, False)
             CollapseList.pop()
+            if mn.Candidate is not None:
+                resort = True
         print(("  Completed. [%d] vertices collapsed." % (CollapseCount)))
+        return CollapseCount, resort
+    def DoProgressiveMesh(self, ratio):
+        t1 = time.time()
+        target = self.RawVertexCount * ratio
+#        print ("DEBUG: DoProgressiveMesh(): ratio=%f, target=%f" % (ratio, target))
+        new_Faces = list()
+        new_Verts = list()
+        CollapseList = self.BeginCollapseReplay()
+        CollapseCount, resort = self.ReplayCollapses(CollapseList, target)
+        self.UpdateVerticesAndTriangles()
+        # costs do not change here, so sorting once gives the same order as
+        # sorting after every collapse onto a candidate
+        if resort:
+            self.vertices.sort(key=lambda vert: vert.Cost, reverse=True)
 
 ##        print ("INSPECTION: self.vertices #=%d, self.triangles #=%d" % (len(self.vertices), len(self.triangles)))
 ##        s = ""
@@ -727,7 +1051,64 @@ class ProgMesh:
         print ("Results: new verts = %d, new faces = %d" % (newVertCount, newFaceCount))
                         
         return (newVertCount, new_Verts, newFaceCount, new_Faces, self.CollapseMap)
-        
+    def ComputeCollapsePlans(self, ratios=None, vertexCounts=None):
+        """
+        Levels of detail in a single pass: the collapse order is replayed once,
+        from the most to the least detailed level, and the mesh is captured
+        each time it reaches a level. Levels are given as ratios, like
+        DoProgressiveMesh, or as vertex budgets. Returns one CollapsePlan per
+        level, in the order given, with None where DoProgressiveMesh would fail.
+        """
+        t1 = time.time()
+        targets = [self.RawVertexCount * ratio for ratio in (ratios or [])]
+        targets = targets + list(vertexCounts or [])
+        plans = [None] * len(targets)
+        CollapseList = self.BeginCollapseReplay()
+        resort = False
+        for level in sorted(range(len(targets)), key=lambda level: targets[level], reverse=True):
+            CollapseCount, collapsed = self.ReplayCollapses(CollapseList, targets[level])
+            resort = resort or collapsed
+            plans[level] = self.SnapshotCollapsePlan(resort)
+        self.UpdateVerticesAndTriangles()
+        print(("PROFILING: ComputeCollapsePlans(): %d levels completed in %f sec" % (len(targets), time.time()-t1)))
+        return plans
+    def SnapshotCollapsePlan(self, resort):
+        # The CollapsePlan DoProgressiveMesh would return for the current
+        # state of a replay, without re-numbering the vertices
+        vertices = list(self.VertexMap.values())
+        if resort:
+            vertices.sort(key=lambda vert: vert.Cost, reverse=True)
+        if len(vertices) == 0 or len(self.TriangleMap) == 0 or len(vertices) == self.RawVertexCount:
+            return None
+        index = dict((v.ID, i) for i, v in enumerate(vertices))
+        # like in DoProgressiveMesh, a removed vertex left in a triangle keeps its ID
+        faces = [[index.get(v.ID, v.ID) for v in t.vertex] for t in self.TriangleMap.values()]
+        return CollapsePlan([v.Index for v in vertices], faces, self.RawVertexCount)
+
+##########################################################
+#
+# CollapsePlan
+#
+##########################################################
+class CollapsePlan:
+    """
+    The outcome of DoProgressiveMesh as index arrays: output vertex i is
+    vertex Indices[i] of the input mesh, and Faces holds the (F, 3) output
+    triangles. Which vertices survive and how the triangles are rewired only
+    depends on the topology and the collapse order, so a plan computed on one
+    frame decimates every frame with the same triangles by fancy indexing
+    (Gather), and keeps the vertex correspondence between them.
+    """
+    def __init__(self, indices, faces, vertexCount):
+        self.Indices = np.asarray(indices, dtype=np.int64)
+        self.Faces = np.asarray(faces, dtype=np.int32).reshape(-1, 3)
+        self.VertexCount = vertexCount
+    def Gather(self, values):
+        # per vertex array (or structured PLY vertex data) of an input frame
+        if len(values) != self.VertexCount:
+            raise ValueError("CollapsePlan: expected %d vertices, got %d" % (self.VertexCount, len(values)))
+        return values[self.Indices]
+
 
 def main():
     # cube: 6 points, 6 quads, 12 triangles
@@ -10,9 +10,22 @@ import os
 
 import sys
 
+# FrameCounter draws the same bar as the per bit rectangles this script used to draw, and ImagePipeline reads the next
+# textures while the current ones are stamped and written
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "scripts"))
+from frame_counter import FrameCounter
+from image_pipeline import ImagePipeline
 
+# Decoded textures kept in memory at once
+MAX_BYTES_IN_FLIGHT = 512 << 20
 
 
+def read_texture(path):
+    img = cv2.imread(path)
+    if img is None:
+        raise IOError("Could not read " + path)
+    return img
+
 
 #======================================================================================================================
 #--------------------------------------------- MAIN Function ----------------------------------------------------------
@@ -46,20 +59,20 @@ def main(args):
                 print("Adding texture " +  str(frame_number+1) + " to group")
                 frame_number = frame_number + 1
     textures_in_group.sort()
-    for current_texture in range(len(textures_in_group)):
-        img = cv2.imread(textures_in_group[current_texture])
-        # Read image
-        height, width, channels = img.shape
+    counter = FrameCounter(16, encoderWindowSize)
+    frame_numbers = {textures_in_group[i]: i for i in range(len(textures_in_group))}
+    jobs = os.cpu_count() or 1
+    pipeline = ImagePipeline(
+        read_texture,
         # Read binary from frame number
-        print(textures_in_group[current_texture] + " " + '{0:016b}'.format(current_texture))
-        for index, value in enumerate('{0:016b}'.format(current_texture)):
-            color = (0,0,0)
-            if(value == '1'):
-                color = (255,255,255)
-            cv2.rectangle(img,(15-index*encoderWindowSize, height-1-encoderWindowSize),((15-index+1)*encoderWindowSize,height-1),color,-1)
-        
+        lambda path, img: counter.stamp(img, frame_numbers[path]),
         # save the image
-        cv2.imwrite(textures_in_group[current_texture], img)
+        cv2.imwrite,
+        readers=jobs, writers=jobs, prefetch=2 * jobs, max_bytes=MAX_BYTES_IN_FLIGHT)
+    for path, written in pipeline.run(textures_in_group):
+        if not written:
+            raise IOError("Could not write " + path)
+        print(path + " " + '{0:016b}'.format(frame_numbers[path]))
 
     print("Finished adding binary frame counter to textures");
     print("Make sure this isn't bleeding into your textures. You might need to scale your UVs to keep square texture.")
@@ -1,71 +1,177 @@
 # Binary sequence texture encoder
 # Takes a sequence of PNG images
-# Adds a macro 
+# Adds a macro
 
-# importing cv2 
+# importing cv2
 import cv2
-  
-# importing os module  
+
+# importing os module
 import os
 
 import sys
+import time
+import argparse
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# FrameCounter and ImagePipeline are shared with the texture stage of scripts/Encoder.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "scripts"))
+from frame_counter import FrameCounter
+from image_pipeline import ImagePipeline
 
 
+# JPEG re-encoding moves the stamped pixels a little, so their stamps are compared with some slack
+LOSSY_TOLERANCE = 48
 
+# Decoded counter bars kept in memory at once while verifying
+DEFAULT_MAX_BYTES = 512 << 20
 
 
+#======================================================================================================================
+#--------------------------------------------- Stamping engine --------------------------------------------------------
+#======================================================================================================================
+
+def write_image(path, img):
+    # Encodes to a temporary file next to path and renames it over path, so an interrupted run never leaves a broken image
+    ok, data = cv2.imencode(os.path.splitext(path)[1], img)
+    if not ok:
+        raise IOError("Could not encode " + path)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data.tobytes())
+    os.replace(temp_path, path)
+
+def read_texture(task, counter, force=False):
+    # Returns the image to stamp for a (source, destination, frame number) task, or None if destination already
+    # carries the right stamp
+    source, destination, frame_number = task
+    tolerance = LOSSY_TOLERANCE if os.path.splitext(destination)[1].lower() in ('.jpg', '.jpeg') else 0
+    img = None
+    if os.path.exists(destination):
+        img = cv2.imread(destination)
+        if img is not None and not force and counter.has_stamp(img, frame_number, tolerance):
+            return None
+    if destination != source or img is None:
+        img = cv2.imread(source)
+    if img is None:
+        raise IOError("Could not read " + source)
+    return img
+
+def stamp_file(task, counter, force=False):
+    # Returns "skipped" if the destination already carries the right stamp, "stamped" otherwise
+    img = read_texture(task, counter, force)
+    if img is None:
+        return "skipped"
+    write_image(task[1], counter.stamp(img, task[2]))
+    return "stamped"
+
+def init_worker():
+    # Every worker already runs in parallel, so OpenCV's own threads would only compete with each other
+    cv2.setNumThreads(1)
+
+def stamp_files(textures, counter, output_path=None, jobs=None, force=False):
+    # Stamps textures[i] with frame number i in a pool of worker processes, each holding one image at a time. Stamped
+    # images are written to output_path, or over the sources when it is None. Returns the number of stamped and skipped
+    # images
+    if len(textures) > (1 << counter.bits):
+        raise ValueError(str(len(textures)) + " textures need more than " + str(counter.bits) + " bits")
+    destinations = textures
+    if output_path is not None:
+        os.makedirs(output_path, exist_ok=True)
+        destinations = [os.path.join(output_path, os.path.basename(texture)) for texture in textures]
+    counts = {"stamped": 0, "skipped": 0}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as executor:
+        futures = [executor.submit(stamp_file, (textures[i], destinations[i], i), counter, force) for i in range(len(textures))]
+        for i in range(len(futures)):
+            result = futures[i].result()
+            counts[result] = counts[result] + 1
+            print(destinations[i] + " " + format(i, '0' + str(counter.bits) + 'b') + " " + result)
+    return counts["stamped"], counts["skipped"]
+
+def read_counter_region(path, counter):
+    img = cv2.imread(path)
+    if img is None:
+        raise IOError("Could not read " + path)
+    # only the bar is kept, so a batch of them takes little memory
+    return counter.region(img).copy()
+
+def verify_files(textures, counter, jobs=None, batch_size=256, max_bytes=DEFAULT_MAX_BYTES):
+    # Decodes the frame counter of every texture, reading them in parallel, and returns the (index, frame number)
+    # of the textures that don't carry their own index
+    jobs = jobs or os.cpu_count() or 1
+    pipeline = ImagePipeline(functools.partial(read_counter_region, counter=counter), readers=jobs, prefetch=2 * jobs, max_bytes=max_bytes)
+    mismatches = []
+    regions = []
+    for index, (path, region) in enumerate(pipeline.run(textures)):
+        regions.append(region)
+        if len(regions) == batch_size or index == len(textures) - 1:
+            first = index + 1 - len(regions)
+            frame_numbers = counter.decode(np.stack(regions))
+            for i in np.nonzero(frame_numbers != np.arange(first, index + 1))[0]:
+                mismatches.append((first + int(i), int(frame_numbers[i])))
+            regions = []
+    return mismatches
+
 #======================================================================================================================
 #--------------------------------------------- MAIN Function ----------------------------------------------------------
 #======================================================================================================================
 
-def main(args):
-    encode_path = "encode"
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Stamps a binary frame counter into a sequence of PNG textures")
+    parser.add_argument("encode_path", nargs="?", default="encode", help="folder with the textures, relative to this script unless absolute")
+    parser.add_argument("--output", help="folder for the stamped textures. By default the textures are replaced, one file at a time")
+    parser.add_argument("--jobs", type=int, help="number of worker processes, or of reader threads with --verify, defaults to one per CPU")
+    parser.add_argument("--max-memory", type=int, default=DEFAULT_MAX_BYTES >> 20, help="MB of decoded counter bars to keep in memory at once with --verify")
+    parser.add_argument("--window-size", type=int, default=8, help="size of a frame counter block in pixels")
+    parser.add_argument("--bits", type=int, default=16, help="number of frame counter blocks")
+    parser.add_argument("--verify", action="store_true", help="only read the frame counters back and report textures that don't match their index")
+    parser.add_argument("--force", action="store_true", help="stamp textures again even if they already carry the right frame number")
+    return parser.parse_args(args[1:])
 
+def main(args):
+    arguments = parse_arguments(args)
     if  len(args) < 2:
         print("Defaulting to the /encode folder for files since an argument was not provided")
-    else:
-        encode_path = args[1]
-    # encode_path = '/home/appaji/XROS/OBJ Captures/yoga_platform_tex-003/partial'
+    encode_path = arguments.encode_path
     print(encode_path)
 
-    dirname = '/home/appaji/XROS/OBJ Captures/yoga_platform_tex-003/partial/small'
+    dirname = os.path.dirname(os.path.realpath(__file__))
 
     print(dirname)
-    encoderWindowSize = 8;
+    counter = FrameCounter(arguments.bits, arguments.window_size)
     frame_number = 0
     textures_in_group = []
 
     # TODO: Add path to where you can to encode, default to this
-    Data_Path = dirname + "/" + encode_path
+    Data_Path = os.path.join(dirname, encode_path)
     print(Data_Path)
 
     # Exception Handling : If 'encode' folder is not there, create one
     assert os.path.exists(Data_Path), 'The Dataset Folder not found. Please consider giving full(absolute) file path.'
-    print(os.listdir(Data_Path))
 
     for files in os.listdir(Data_Path):
         if files.endswith(".png"): # Exception Handling
-                print(files)
                 textures_in_group.append(Data_Path+"/"+files)
-                print("Adding texture " +  str(frame_number+1) + " to group")
                 frame_number = frame_number + 1
     textures_in_group.sort()
-    for current_texture in range(len(textures_in_group)):
-        img = cv2.imread(textures_in_group[current_texture])
-        # Read image
-        height, width, channels = img.shape
-        # Read binary from frame number
-        print(textures_in_group[current_texture] + " " + '{0:016b}'.format(current_texture))
-        for index, value in enumerate('{0:016b}'.format(current_texture)):
-            color = (0,0,0)
-            if(value == '1'):
-                color = (255,255,255)
-            cv2.rectangle(img,(15-index*encoderWindowSize, height-1-encoderWindowSize),((15-index+1)*encoderWindowSize,height-1),color,-1)
-        
-        # save the image
-        cv2.imwrite(textures_in_group[current_texture], img)
-
-    print("Finished adding binary frame counter to textures");
+    print("Stamping " + str(frame_number) + " textures")
+
+    start = time.time()
+    if arguments.verify:
+        if arguments.output is not None:
+            textures_in_group = [os.path.join(arguments.output, os.path.basename(texture)) for texture in textures_in_group]
+        mismatches = verify_files(textures_in_group, counter, arguments.jobs, max_bytes=arguments.max_memory << 20)
+        seconds = time.time() - start
+        for index, frame_number in mismatches[:20]:
+            print(textures_in_group[index] + " reads frame " + str(frame_number) + " instead of " + str(index))
+        print(str(len(mismatches)) + " of " + str(len(textures_in_group)) + " textures don't match their frame number, checked in " + "%.1f" % seconds + " sec (" + "%.1f" % (len(textures_in_group) / max(seconds, 1e-9)) + " frames per sec)")
+        return
+    stamped, skipped = stamp_files(textures_in_group, counter, arguments.output, arguments.jobs, arguments.force)
+    seconds = time.time() - start
+
+    print("Finished adding binary frame counter to textures: " + str(stamped) + " stamped, " + str(skipped) + " already stamped, in " + "%.1f" % seconds + " sec (" + "%.1f" % (len(textures_in_group) / max(seconds, 1e-9)) + " frames per sec)");
     print("Make sure this isn't bleeding into your textures. You might need to scale your UVs to keep square texture.")
     print("We'll add UV autoscaling and appending later.")
 #======================================================================================================================
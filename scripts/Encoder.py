@@ -1,22 +1,33 @@
+import shutil
 from shutil import which
-import sys
 import commentjson as json
 import os
 import subprocess
 import shlex
+import argparse
+import queue
+import threading
+import tempfile
+import time
 from tqdm import tqdm
 
 
 import io
-from contextlib import redirect_stdout
-import struct
+from contextlib import contextmanager, nullcontext, redirect_stdout
 import audioread
 
+from build_cache import BuildCache
+from sequence_index import SequenceIndex, index_sidecar_path
+from ktx2 import read_headers as read_ktx2_headers
+from packing import CHUNK_VERSION, chunk_files, pack_files
+from telemetry import Telemetry
+
 
 def convert_pounds_to_c_style(s):
-    # export_#####.png => export_%05u.png
+    # export_#####.png => export_%05u.png, export_[#####].png => export_%05u.png
     pound_count = s.count("#")
-    return s.replace("#" * pound_count, f"%0{pound_count}u")
+    pounds = "#" * pound_count
+    return s.replace(f"[{pounds}]", pounds).replace(pounds, f"%0{pound_count}u")
 
 
 def check_executables(config):
@@ -69,6 +80,20 @@ def check_all_fields(config):
         print("❌ Path to Geometry data is not specified")
         exit(1)
 
+    if config.get("ABC_EXPORT_FORMAT", "obj") not in ("obj", "glb", "ply"):
+        print("❌ `ABC_EXPORT_FORMAT` must be one of: obj, glb, ply")
+        exit(1)
+
+    blob_size = config.get("PACK_BLOB_SIZE_MB", 256)
+    if not isinstance(blob_size, (int, float)) or blob_size <= 0:
+        print("❌ `PACK_BLOB_SIZE_MB` must be a positive number")
+        exit(1)
+
+    chunk_size = config.get("GEOMETRY_CHUNK_SIZE", 0)
+    if not isinstance(chunk_size, int) or chunk_size < 0:
+        print("❌ `GEOMETRY_CHUNK_SIZE` must be a non-negative integer")
+        exit(1)
+
     if config.get("ImagesPath"):
         if isinstance(config.get("KTX2_FIRST_FILE"), int) and isinstance(config.get("KTX2_FILE_COUNT"), int):
             pass
@@ -84,50 +109,233 @@ def check_all_fields(config):
         exit(1)
 
 
-def match_pattern(pattern, file_name):
-    # Assumes pattern contains seven pound characters (#)
-    # Implying file name indices are padded with atmost 7 zeroes. Eg: 0000001
-    PAD_LENGTH = pattern.count('#')
-    PAD_STRING = '#' * PAD_LENGTH
+# sequence indexes of this run, by (OutputDirectory, path pattern)
+_sequence_indexes = {}
 
-    pad_index = pattern.find(PAD_STRING)
-    if (
-        (pattern[:pad_index] == file_name[:pad_index])
-        and (pattern[pad_index + PAD_LENGTH :] == file_name[pad_index + PAD_LENGTH :])
-        and file_name[pad_index : pad_index + PAD_LENGTH].isdigit()
-    ):
-        return True
-    return False
+
+def index_sequence(config, path_pattern):
+    """
+    Indexes the files matching `path_pattern`. The index is kept in a sidecar
+    file in OutputDirectory and reused while the directory is unchanged.
+    Within a run a pattern is only indexed (and checked for duplicate and
+    missing frames) once, later calls return the same index.
+    """
+    key = (config["OutputDirectory"], path_pattern)
+    if key in _sequence_indexes:
+        return _sequence_indexes[key]
+    sidecar_path = index_sidecar_path(config["OutputDirectory"], path_pattern)
+    index = SequenceIndex.load(path_pattern, sidecar_path)
+    index.save(sidecar_path)
+
+    if index.duplicates:
+        print(f"❌ Multiple files share a frame number in {path_pattern}:")
+        for frame, paths in list(index.duplicates.items())[:10]:
+            print(f"  {frame}: {paths}")
+        print("Ignore and proceed? (y/n): ", end="")
+        choice = input()
+        if choice != "y":
+            exit(1)
+    gaps = index.gaps()
+    if gaps:
+        missing_count = sum(last - first + 1 for first, last in gaps)
+        print(
+            f"⚠️ Warning: {missing_count} frames are missing from {path_pattern}, first missing ranges: {gaps[:10]}"
+        )
+    _sequence_indexes[key] = index
+    return index
 
 
-def check_total_frames(config):
+def resolve_jobs(value):
+    """
+    Converts the `JOBS` config field (or `--jobs` argument) to a worker count.
+    "auto" (the default) uses every CPU available to this process.
+    """
+    if value is None or value == "auto":
+        if hasattr(os, "sched_getaffinity"):
+            return max(1, len(os.sched_getaffinity(0)))
+        return os.cpu_count() or 1
+    jobs = int(value)
+    if jobs < 1:
+        print(f"❌ Invalid number of jobs: {value}")
+        exit(1)
+    return jobs
+
+
+def split_cpu_budget(jobs, batch_count):
+    """
+    Splits `jobs` CPUs between concurrent batches.
+    Returns the number of batches to run at once and the threads each of them
+    may use. The threads left over by an uneven split go to the first
+    batches, so the counts add up to `jobs`. Batch i runs with the count at
+    i % concurrent_batches.
+    """
+    concurrent_batches = max(1, min(jobs, batch_count))
+    threads, leftover = divmod(max(jobs, concurrent_batches), concurrent_batches)
+    return concurrent_batches, [
+        threads + (1 if i < leftover else 0) for i in range(concurrent_batches)
+    ]
+
+
+class CommandPool:
+    """
+    Runs external commands on a bounded set of worker threads.
+
+    Commands are queued with `submit` and picked up by `jobs` workers. Once a
+    command fails, queued commands are dropped and running ones are terminated,
+    so `first_failure()` reports the failing command with the lowest index.
+    The wall time of every successful command is kept in `durations`.
+
+    A command can be given a `prepare` callable returning a context manager,
+    which the worker enters right before running the command and exits once
+    it has finished, to create its inputs and clean them up. An exception
+    raised while preparing, or by `on_success`, fails the command.
+    """
+
+    def __init__(self, jobs, progress_bar=None, queue_size=0):
+        self.jobs = jobs
+        self.progress_bar = progress_bar
+        self.failures = []
+        self.durations = {}
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._running = set()
+        self._terminated = set()
+        self._workers = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(jobs)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.cancel()
+        self.close()
+        return False
+
+    def submit(self, index, command, on_success=None, prepare=None):
+        """
+        Queues `command` (a shell-like string) under `index`. Blocks while the
+        queue is full. Returns False if the pool has been cancelled.
+        """
+        item = (index, command, on_success, prepare)
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            for process in self._running:
+                self._terminated.add(process)
+                process.terminate()
+
+    def close(self):
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def first_failure(self):
+        if not self.failures:
+            return None
+        return min(self.failures, key=lambda failure: failure[0])
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            index, command, on_success, prepare = item
+            if self._cancelled.is_set():
+                continue
+            started = time.perf_counter()
+            try:
+                with prepare() if prepare is not None else nullcontext():
+                    rc = self._run(command)
+            except Exception as error:
+                print(f"❌ {error}")
+                rc = -1
+            if rc is None:
+                continue
+            if rc:
+                with self._lock:
+                    self.failures.append((index, command, rc))
+                self.cancel()
+                continue
+            with self._lock:
+                self.durations[index] = time.perf_counter() - started
+            if on_success is not None:
+                # a failing callback (eg: a missing output) fails the command, without taking the worker down with it
+                try:
+                    on_success(index)
+                except Exception as error:
+                    print(f"❌ {error}")
+                    with self._lock:
+                        self.failures.append((index, command, -1))
+                    self.cancel()
+                    continue
+            if self.progress_bar is not None:
+                self.progress_bar.update(1)
+
+    def _run(self, command):
+        # Returns the exit code, or None if the command was cancelled
+        with self._lock:
+            if self._cancelled.is_set():
+                return None
+            try:
+                process = subprocess.Popen(
+                    shlex.split(command), stdout=subprocess.DEVNULL
+                )
+            except OSError as error:
+                print(f"❌ {error}")
+                return -1
+            self._running.add(process)
+        rc = process.wait()
+        with self._lock:
+            self._running.discard(process)
+            if process in self._terminated:
+                return None
+        return rc
+
+
+def check_total_frames(config, jobs=None):
     """
     Checks whether the combination of geometry frames,
     texture frames and their corresponding frame rates
     are compatible
     """
-    drc_directory, drc_pattern = os.path.split(config["DRACOFilesPath"])
-    geometry_frame_count = len(
-        [file for file in os.listdir(drc_directory) if match_pattern(drc_pattern, file)]
-    )
+    geometry_frame_count = len(index_sequence(config, config["DRACOFilesPath"]))
+    texture_segments = index_sequence(config, config["KTX2FilesPath"]).paths()
+    if not geometry_frame_count or not texture_segments:
+        print("❌ No DRACO or KTX2 files found")
+        exit(1)
 
-    ktx2_directory, ktx2_pattern = os.path.split(config["KTX2FilesPath"])
-    texture_segments = sorted(
-        [
-            file
-            for file in os.listdir(ktx2_directory)
-            if match_pattern(ktx2_pattern, file)
-        ]
-    )
+    # only the KTX2 header and level index of each segment are read
+    segment_headers, errors = read_ktx2_headers(texture_segments, jobs)
+    if errors:
+        print(f"❌ {len(errors)} invalid KTX2 segments:")
+        for error in errors:
+            print(f"    {error}")
+        exit(1)
 
-    # not including last segments count because, it might not be full segment
-    texture_frame_count = (len(texture_segments) - 1) * config["KTX2_BATCH_SIZE"]
-    with open(os.path.join(ktx2_directory, texture_segments[-1]), "rb") as f:
-        last_segment = f.read()
+    for header in segment_headers[:-1]:
+        if header.frame_count != config["KTX2_BATCH_SIZE"]:
+            print(
+                f"⚠️ Warning: {header.path} has {header.frame_count} layers, expected KTX2_BATCH_SIZE ({config['KTX2_BATCH_SIZE']})"
+            )
+    sizes = {(header.pixel_width, header.pixel_height) for header in segment_headers}
+    if len(sizes) > 1:
+        print(f"⚠️ Warning: KTX2 segments have different sizes: {sorted(sizes)}")
 
-    # Extracting layerCount according to KTX2 spec: https://registry.khronos.org/KTX/specs/2.0/ktxspec.v2.html
-    last_segment_frame_count = struct.unpack("<I", last_segment[32:36])[0]
-    texture_frame_count += last_segment_frame_count
+    texture_frame_count = sum(header.frame_count for header in segment_headers)
 
     print(f"Geometry frame count: {geometry_frame_count}")
     print(f"Texture frame count (not segments): {texture_frame_count}")
@@ -154,13 +362,306 @@ def check_total_frames(config):
     return uvol_durations, geometry_frame_count, len(texture_segments)
 
 
-def main():
-    if len(sys.argv) != 2:
-        print(
-            "❌ Invalid number of arguments. Please supply project-config.json as argument"
+def pack_sequence(config, build_cache, path_pattern, name):
+    """
+    Concatenates the files of a sequence into blobs in OutputDirectory/PACKED
+    and returns the manifest entry describing them. Each file gets an
+    {"blob", "offset", "length"} entry, in frame order, so players can fetch
+    (and coalesce) frames with HTTP range requests.
+    """
+    blob_pattern = os.path.join(config["OutputDirectory"], "PACKED", f"{name}_[####].bin")
+    os.makedirs(os.path.dirname(blob_pattern), exist_ok=True)
+    max_blob_size = int(config.get("PACK_BLOB_SIZE_MB", 256) * 1024 * 1024)
+    blob_paths, entries = pack_files(
+        index_sequence(config, path_pattern).paths(),
+        convert_pounds_to_c_style(blob_pattern),
+        max_blob_size,
+        build_cache,
+        {"PACK_BLOB_SIZE_MB": config.get("PACK_BLOB_SIZE_MB", 256)},
+    )
+    print(f"✅ Packed {len(entries)} {name} files into {len(blob_paths)} blobs")
+    return {
+        "path": os.path.relpath(blob_pattern, config["OutputDirectory"]),
+        "blobCount": len(blob_paths),
+        "frames": entries,
+    }
+
+
+def geometry_chunk_size(config):
+    """
+    Frames per geometry chunk. Defaults to the number of geometry frames
+    played during one KTX2 segment, so chunks and segments line up.
+    """
+    if config.get("GEOMETRY_CHUNK_SIZE", 0):
+        return config["GEOMETRY_CHUNK_SIZE"]
+    frames = (
+        config["KTX2_BATCH_SIZE"]
+        * config["GEOMETRY_FRAME_RATE"]
+        / config["TEXTURE_FRAME_RATE"]
+    )
+    return max(1, round(frames))
+
+
+def chunk_geometry(config, build_cache):
+    """
+    Groups the DRC frames into chunk files in OutputDirectory/CHUNKS and
+    returns the manifest entry describing the chunk layout.
+    """
+    chunk_size = geometry_chunk_size(config)
+    chunk_pattern = os.path.join(config["OutputDirectory"], "CHUNKS", "geometry_[#####].uvgc")
+    os.makedirs(os.path.dirname(chunk_pattern), exist_ok=True)
+    frame_paths = index_sequence(config, config["DRACOFilesPath"]).paths()
+    chunk_paths = chunk_files(
+        frame_paths,
+        chunk_size,
+        convert_pounds_to_c_style(chunk_pattern),
+        build_cache,
+        {"GEOMETRY_CHUNK_SIZE": chunk_size},
+    )
+    print(f"✅ Grouped {len(frame_paths)} geometry frames into {len(chunk_paths)} chunks")
+    return {
+        "format": "uvgc",
+        "version": CHUNK_VERSION,
+        "path": os.path.relpath(chunk_pattern, config["OutputDirectory"]),
+        "chunkSize": chunk_size,
+        "chunkCount": len(chunk_paths),
+    }
+
+
+def draco_settings(config):
+    return {
+        "Q_POSITION_ATTR": config.get("Q_POSITION_ATTR", 11),
+        "Q_TEXTURE_ATTR": config.get("Q_TEXTURE_ATTR", 10),
+        "Q_NORMAL_ATTR": config.get("Q_NORMAL_ATTR", 8),
+        "Q_GENERIC_ATTR": config.get("Q_GENERIC_ATTR", 8),
+        "DRACO_COMPRESSION_LEVEL": config.get("DRACO_COMPRESSION_LEVEL", 7),
+    }
+
+
+def draco_command(config, mesh_path, drc_path):
+    settings = draco_settings(config)
+    return f'{config["draco_encoder"]} -i "{mesh_path}" -o "{drc_path}" -qp {settings["Q_POSITION_ATTR"]} -qt {settings["Q_TEXTURE_ATTR"]} -qn {settings["Q_NORMAL_ATTR"]} -qg {settings["Q_GENERIC_ATTR"]} -cl {settings["DRACO_COMPRESSION_LEVEL"]}'
+
+
+def is_valid_drc(path):
+    # Draco bitstreams start with the "DRACO" magic string
+    try:
+        with open(path, "rb") as f:
+            return f.read(5) == b"DRACO"
+    except OSError:
+        return False
+
+
+def import_abc(bpy, abc_file_path):
+    """
+    Replaces the scene contents with the ABC file.
+    Returns the first and last frame numbers of the ABC file.
+    """
+    # https://blender.stackexchange.com/a/220016/165060
+    # removes the default cube and cone in scene
+    while bpy.data.objects:
+        bpy.data.objects.remove(bpy.data.objects[0], do_unlink=True)
+
+    # import the ABC file
+    bpy.ops.wm.alembic_import(filepath=abc_file_path)
+
+    # get the number of frames in the ABC file
+    return bpy.context.scene.frame_start, bpy.context.scene.frame_end
+
+
+def export_abc_frames(
+    bpy, config, frame_start, frame_end, progress_bar, export_format="obj"
+):
+    """
+    Exports every frame of the imported ABC file, yielding the
+    (intermediate path, DRC path) pair of each frame as soon as it is written.
+
+    "obj" uses Blender's OBJ exporter. "glb" and "ply" read the evaluated
+    meshes straight into NumPy arrays and write a binary file instead.
+    """
+    stdout = io.StringIO()
+    if export_format != "obj":
+        import mesh_export
+
+        # the alembic importer leaves the imported objects selected
+        objects = list(bpy.context.selected_objects)
+        write_mesh = mesh_export.WRITERS[export_format]
+
+    for frame in range(frame_start, frame_end + 1):
+        # set the current frame
+        bpy.context.scene.frame_set(frame)
+        # generate the output file path
+        output_path = os.path.join(
+            config["OutputDirectory"],
+            export_format.upper(),
+            f"frame_{frame:07}.{export_format}",
+        )
+
+        progress_bar.set_description(f"🔍 Extracting frame {frame}")
+        if export_format == "obj":
+            with redirect_stdout(stdout):
+                # export the current frame as an OBJ file
+                # by silencing the output. draco_encoder ignores materials, so
+                # no .mtl file is written next to it
+                bpy.ops.export_scene.obj(
+                    filepath=output_path, use_selection=True, use_materials=False
+                )
+        else:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            write_mesh(
+                output_path, *mesh_export.extract_mesh_arrays(objects, depsgraph)
+            )
+
+        yield output_path, os.path.join(
+            config["OutputDirectory"], "DRC", f"frame_{frame:07}.{export_format}.drc"
         )
 
-    if sys.argv[1] == "create-template":
+
+def compress_mesh_frames(
+    config,
+    jobs,
+    build_cache,
+    frames,
+    progress_bar,
+    queue_size=0,
+    delete_meshes=False,
+    telemetry=None,
+):
+    """
+    Compresses `frames`, an iterable of (mesh path, DRC path) pairs, with
+    `jobs` concurrent draco_encoder processes. `frames` may be a generator that
+    produces mesh files while earlier ones are being compressed.
+
+    Frames whose DRC is up to date in `build_cache` are skipped. With
+    `delete_meshes`, each mesh file is removed once its DRC has been verified.
+    Every compressed frame is recorded in `telemetry`, if given.
+    """
+    settings = draco_settings(config)
+
+    def on_compressed(frame_index, mesh_path, drc_path, key, input_bytes):
+        if telemetry is not None:
+            telemetry.record_item(
+                "draco",
+                os.path.basename(drc_path),
+                pool.durations[frame_index],
+                input_bytes,
+                os.path.getsize(drc_path),
+            )
+        on_success(mesh_path, drc_path, key)
+
+    def on_success(mesh_path, drc_path, key):
+        build_cache.update(drc_path, key)
+        if delete_meshes:
+            if is_valid_drc(drc_path):
+                os.remove(mesh_path)
+            else:
+                print(f"⚠️ Keeping {mesh_path}, {drc_path} is not a valid DRC file")
+
+    mesh_paths = []
+    skipped_frames = 0
+    try:
+        with CommandPool(jobs, progress_bar, queue_size) as pool:
+            for frame_index, (mesh_path, drc_path) in enumerate(frames):
+                mesh_paths.append(mesh_path)
+                key = build_cache.key([mesh_path], settings)
+                if build_cache.is_fresh(drc_path, key):
+                    skipped_frames += 1
+                    on_success(mesh_path, drc_path, key)
+                    progress_bar.update(1)
+                    continue
+                build_cache.invalidate(drc_path)
+                command = draco_command(config, mesh_path, drc_path)
+                input_bytes = os.path.getsize(mesh_path)
+                callback = lambda frame_index, mesh_path=mesh_path, drc_path=drc_path, key=key, input_bytes=input_bytes: on_compressed(frame_index, mesh_path, drc_path, key, input_bytes)
+                if not pool.submit(frame_index, command, callback):
+                    break
+    finally:
+        build_cache.save()
+    progress_bar.close()
+    if skipped_frames:
+        print(f"💡 Skipped {skipped_frames} up to date frames")
+        if telemetry is not None:
+            telemetry.record_skipped("draco", skipped_frames)
+
+    failure = pool.first_failure()
+    if failure:
+        frame_index, command, rc = failure
+        print(f"Failed to compress {os.path.basename(mesh_paths[frame_index])} (frame {frame_index})")
+        print("Command: ", command)
+        exit(1)
+
+
+# file names of the stamped copies of a KTX2 batch, numbered like the source images
+STAMPED_IMAGE_PATTERN = "frame_%07u.tga"
+# decoded images kept in memory while stamping, shared between the concurrent batches
+STAMPING_MAX_BYTES = 1 << 30
+
+
+def frame_counter_settings(config):
+    return {
+        "STAMP_FRAME_COUNTER": True,
+        "FRAME_COUNTER_BITS": config.get("FRAME_COUNTER_BITS", 16),
+        "FRAME_COUNTER_WINDOW_SIZE": config.get("FRAME_COUNTER_WINDOW_SIZE", 8),
+    }
+
+
+@contextmanager
+def stamped_images(config, counter, image_indices, directory, jobs, max_bytes):
+    """
+    Writes frame counter stamped copies of the images of one KTX2 batch to
+    `directory` and deletes them once basisu has compressed the batch. Each
+    source image is decoded once and stamped in memory, with its frame number
+    counted from KTX2_FIRST_FILE. The copies are uncompressed TGAs, which are
+    cheap to write and for basisu to read. Reading, stamping and writing
+    overlap, with at most `max_bytes` of decoded images in memory.
+    """
+    from frame_counter import read_texture, write_tga
+    from image_pipeline import ImagePipeline
+
+    pipeline = ImagePipeline(
+        lambda image_index: read_texture(config["ImagesPath"] % image_index),
+        lambda image_index, img: counter.stamp(img, image_index - config["KTX2_FIRST_FILE"]),
+        lambda image_index, img: write_tga(
+            os.path.join(directory, STAMPED_IMAGE_PATTERN % image_index), img
+        ),
+        readers=jobs,
+        writers=jobs,
+        prefetch=2 * jobs,
+        max_bytes=max_bytes,
+    )
+    os.makedirs(directory)
+    try:
+        for _ in pipeline.run(image_indices):
+            pass
+        yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Encodes geometry and texture sequences into UVOL 2.0"
+    )
+    parser.add_argument(
+        "config",
+        help="path to project-config.json, or `create-template` to write a template config",
+    )
+    parser.add_argument(
+        "--jobs",
+        help="number of encoder processes to run at once, or `auto` to use every CPU. Overrides `JOBS` in the config",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="ignore the build cache in OutputDirectory and encode every frame again",
+    )
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+
+    if arguments.config == "create-template":
         template_data_str = """{
   "name": "",
   "draco_encoder": "", // path to draco_encoder binary
@@ -173,11 +674,23 @@ def main():
   "Q_NORMAL_ATTR": 8, // quantization bits for the normal vector attribute, default=8.
   "Q_GENERIC_ATTR": 8, // quantization bits for any generic attribute, default=8.
   "DRACO_COMPRESSION_LEVEL": 7, // compression level [0-10], most=10, least=0, default=7.
+  "JOBS": "auto", // number of encoder processes to run at once. "auto" uses every CPU.
+  "ABC_EXPORT_FORMAT": "obj", // intermediate format for ABC frames: obj, glb (needs a transcoder enabled draco_encoder) or ply (no UVs).
+  "DELETE_INTERMEDIATE_OBJ": false, // delete intermediate files extracted from ABCFilePath once their DRC file is written.
   "ImagesPath": "", // pattern with hashes.
   "KTX2_FIRST_FILE": 0, // The index of the first file in above pattern. Eg: If PNG/frame_001.png is first texture, this field should be 1
   "KTX2_FILE_COUNT": 0,
   "KTX2_BATCH_SIZE": 7,
   "KTX2FilesPath": "",
+  "STAMP_FRAME_COUNTER": false, // stamp the frame number of each image into its bottom left corner while compressing it. Needs opencv-python.
+  "FRAME_COUNTER_BITS": 16, // number of frame counter blocks.
+  "FRAME_COUNTER_WINDOW_SIZE": 8, // size of a frame counter block in pixels.
+  "PACK_GEOMETRY": false, // also concatenate the DRC frames into packed blobs, indexed per frame in uvol.json.
+  "PACK_TEXTURES": false, // also concatenate the KTX2 segments into packed blobs, indexed per segment in uvol.json.
+  "PACK_BLOB_SIZE_MB": 256, // maximum size of a packed blob.
+  "CHUNK_GEOMETRY": false, // also group consecutive DRC frames into chunk files with a frame offset header.
+  "GEOMETRY_CHUNK_SIZE": 0, // frames per chunk. 0 matches the duration of a KTX2 segment.
+  "REPORT_SLOWEST_FRAMES": 10, // number of slowest frames (and segments) listed in uvol-report.json.
   "GEOMETRY_FRAME_RATE": 30,
   "TEXTURE_FRAME_RATE": 30,
   "OutputDirectory": ""
@@ -191,80 +704,98 @@ def main():
         )
         return
 
-    with open(sys.argv[1]) as f:
+    with open(arguments.config) as f:
         config = json.load(f)
 
     check_executables(config)
     check_all_fields(config)
 
+    if arguments.jobs is not None:
+        config["JOBS"] = arguments.jobs
+    jobs = resolve_jobs(config.get("JOBS", "auto"))
+
     # converting to absolute path to avoid ambiguities later.
     config["OutputDirectory"] = os.path.join(os.getcwd(), config["OutputDirectory"])
+    os.makedirs(config["OutputDirectory"], exist_ok=True)
+    build_cache = BuildCache(config["OutputDirectory"], rebuild=arguments.rebuild)
+    telemetry = Telemetry(config.get("REPORT_SLOWEST_FRAMES", 10))
 
     print("🎯 Dealing with Geomety data")
 
-    stdout = io.StringIO()
-
     if config.get("ABCFilePath", None):
         import bpy
         print("🚧 Obtained ABC File")
 
-        # https://blender.stackexchange.com/a/220016/165060
-        # removes the default cube and cone in scene
-        while bpy.data.objects:
-            bpy.data.objects.remove(bpy.data.objects[0], do_unlink=True)
-
-        # import the ABC file
-        bpy.ops.wm.alembic_import(filepath=config["ABCFilePath"])
-
-        # get the number of frames in the ABC file
-        frame_start = bpy.context.scene.frame_start
-        frame_end = bpy.context.scene.frame_end
+        with telemetry.stage("abc_import"):
+            frame_start, frame_end = import_abc(bpy, config["ABCFilePath"])
+        export_format = config.get("ABC_EXPORT_FORMAT", "obj")
 
-        os.makedirs(os.path.join(config["OutputDirectory"], "OBJ"), exist_ok=True)
-
-        progress_bar = tqdm(range(frame_start, frame_end + 1))
-        for frame in progress_bar:
-            # set the current frame
-            bpy.context.scene.frame_set(frame)
-            # generate the output file path
-            output_path = os.path.join(
-                config["OutputDirectory"], "OBJ", f"frame_{frame:07}.obj"
+        os.makedirs(
+            os.path.join(config["OutputDirectory"], export_format.upper()), exist_ok=True
+        )
+        os.makedirs(os.path.join(config["OutputDirectory"], "DRC"), exist_ok=True)
+        if export_format == "obj":
+            config["OBJFilesPath"] = os.path.join(
+                config["OutputDirectory"], "OBJ", "frame_[#######].obj"
             )
-
-            progress_bar.set_description(f"🔍 Extracting frame {frame}")
-            with redirect_stdout(stdout):
-                # export the current frame as an OBJ file
-                # by silencing the output
-                bpy.ops.export_scene.obj(filepath=output_path, use_selection=True)
-
-        config["OBJFilesPath"] = os.path.join(
-            config["OutputDirectory"], "OBJ", "frame_[#######].obj"
+        config["DRACOFilesPath"] = os.path.join(
+            config["OutputDirectory"], "DRC", f"frame_[#######].{export_format}.drc"
         )
 
-    if config.get("OBJFilesPath", None):
+        progress_bar = tqdm(total=frame_end - frame_start + 1)
+        # Frames are exported on this thread (bpy is not thread safe) and
+        # compressed by the pool while the next frames are being exported.
+        # The bounded queue keeps extraction at most `jobs` frames ahead.
+        # Only the time spent exporting counts towards "abc_extract", while
+        # the "draco" stage spans the whole overlapped run.
+        with telemetry.stage("draco"):
+            compress_mesh_frames(
+                config,
+                jobs,
+                build_cache,
+                telemetry.timed_iterator(
+                    "abc_extract",
+                    export_abc_frames(
+                        bpy, config, frame_start, frame_end, progress_bar, export_format
+                    ),
+                ),
+                progress_bar,
+                queue_size=jobs,
+                delete_meshes=config.get("DELETE_INTERMEDIATE_OBJ", False),
+                telemetry=telemetry,
+            )
+
+    elif config.get("OBJFilesPath", None):
         print("🚧 Obtained OBJ files path")
 
-        directory, pattern = os.path.split(config["OBJFilesPath"])
-        obj_files = sorted(
-            [file for file in os.listdir(directory) if match_pattern(pattern, file)]
-        )
+        pattern = os.path.basename(config["OBJFilesPath"])
+        obj_files = index_sequence(config, config["OBJFilesPath"]).paths()
         os.makedirs(os.path.join(config["OutputDirectory"], "DRC"), exist_ok=True)
         config["DRACOFilesPath"] = os.path.join(
             config["OutputDirectory"], "DRC", pattern + ".drc"
         )
 
-        progress_bar = tqdm(obj_files)
-        frame_index = 0
-        for file in progress_bar:
-            progress_bar.set_description(f"📦 Compressing frame {frame_index}")
-            command = f'{config["draco_encoder"]} -i "{os.path.join(directory, file)}" -o "{os.path.join(config["OutputDirectory"], "DRC", file + ".drc")}" -qp {config.get("Q_POSITION_ATTR", 11)} -qt {config.get("Q_TEXTURE_ATTR", 10)} -qn {config.get("Q_NORMAL_ATTR", 8)} -qg {config.get("Q_GENERIC_ATTR", 8)} -cl {config.get("DRACO_COMPRESSION_LEVEL", 7)}'
-            args = shlex.split(command)
-            rc = subprocess.call(args, stdout=subprocess.DEVNULL)
-            if rc:
-                print(f"Failed to compress {file}")
-                print("Command: ", command)
-                exit(1)
-            frame_index += 1
+        progress_bar = tqdm(total=len(obj_files))
+        progress_bar.set_description(f"📦 Compressing frames ({jobs} jobs)")
+        with telemetry.stage("draco"):
+            compress_mesh_frames(
+                config,
+                jobs,
+                build_cache,
+                (
+                    (
+                        obj_path,
+                        os.path.join(
+                            config["OutputDirectory"],
+                            "DRC",
+                            os.path.basename(obj_path) + ".drc",
+                        ),
+                    )
+                    for obj_path in obj_files
+                ),
+                progress_bar,
+                telemetry=telemetry,
+            )
 
     if config.get("DRACOFilesPath", None):
         print("✅ Obtained DRACO files")
@@ -273,30 +804,113 @@ def main():
     if config.get("ImagesPath", None):
         config["ImagesPath"] = convert_pounds_to_c_style(config["ImagesPath"])
         print("🚧 Obtained Images path.")
-        current_file_index = config["KTX2_FIRST_FILE"]
         os.makedirs(os.path.join(config["OutputDirectory"], "KTX2"), exist_ok=True)
 
-        progress_bar = tqdm(
-            range(
-                config["KTX2_FIRST_FILE"],
-                config["KTX2_FILE_COUNT"],
-                config["KTX2_BATCH_SIZE"],
-            )
+        batch_starts = range(
+            config["KTX2_FIRST_FILE"],
+            config["KTX2_FILE_COUNT"],
+            config["KTX2_BATCH_SIZE"],
+        )
+        concurrent_batches, batch_threads = split_cpu_budget(
+            jobs, len(batch_starts)
         )
-        for current_file_index in progress_bar:
-            progress_bar.set_description(
-                f'📦 Compressing images from {current_file_index} to {current_file_index + config["KTX2_BATCH_SIZE"] - 1}'
+
+        ktx2_settings = {"KTX2_BATCH_SIZE": config["KTX2_BATCH_SIZE"]}
+        counter = None
+        if config.get("STAMP_FRAME_COUNTER", False):
+            from frame_counter import FrameCounter
+
+            ktx2_settings.update(frame_counter_settings(config))
+            counter = FrameCounter(
+                ktx2_settings["FRAME_COUNTER_BITS"],
+                ktx2_settings["FRAME_COUNTER_WINDOW_SIZE"],
             )
-            command = f'{config["basisu"]} -ktx2 -tex_type video -multifile_printf "{config["ImagesPath"]}" -multifile_num {config["KTX2_BATCH_SIZE"]} -multifile_first {current_file_index} -y_flip -output_file "{os.path.join(config["OutputDirectory"], "KTX2", "texture_%07u"%(current_file_index//config["KTX2_BATCH_SIZE"]))}.ktx2"'
-            args = shlex.split(command)
-            rc = subprocess.call(args, stdout=subprocess.DEVNULL)
-            if rc:
+            last_frame = (batch_starts[-1] if batch_starts else 0) + config["KTX2_BATCH_SIZE"] - 1 - config["KTX2_FIRST_FILE"]
+            if last_frame >= 1 << counter.bits:
                 print(
-                    f'Failed to compress images with indices: [{current_file_index}, {current_file_index + config["KTX2_BATCH_SIZE"]}]'
+                    f"❌ Frame numbers up to {last_frame} don't fit in FRAME_COUNTER_BITS ({counter.bits})"
                 )
-                print("Command: ", command)
                 exit(1)
 
+        progress_bar = tqdm(total=len(batch_starts))
+        progress_bar.set_description(
+            f"📦 Compressing image batches ({concurrent_batches} batches, {sum(batch_threads)} threads)"
+        )
+        def on_segment_compressed(batch_index, ktx2_path, key, input_bytes):
+            telemetry.record_item(
+                "basisu",
+                os.path.basename(ktx2_path),
+                pool.durations[batch_index],
+                input_bytes,
+                os.path.getsize(ktx2_path),
+            )
+            build_cache.update(ktx2_path, key)
+
+        skipped_batches = 0
+        # stamped copies are written next to the outputs, and each batch deletes its own once compressed
+        stamped_images_directory = (
+            tempfile.TemporaryDirectory(prefix=".uvol-stamped-", dir=config["OutputDirectory"])
+            if counter is not None
+            else nullcontext()
+        )
+        with telemetry.stage("basisu"), stamped_images_directory as stamped_directory:
+            try:
+                with CommandPool(concurrent_batches, progress_bar) as pool:
+                    for batch_index, current_file_index in enumerate(batch_starts):
+                        ktx2_path = os.path.join(config["OutputDirectory"], "KTX2", "texture_%07u.ktx2"%(current_file_index//config["KTX2_BATCH_SIZE"]))
+                        image_indices = [
+                            image_index
+                            for image_index in range(current_file_index, current_file_index + config["KTX2_BATCH_SIZE"])
+                            if os.path.exists(config["ImagesPath"] % image_index)
+                        ]
+                        image_paths = [config["ImagesPath"] % image_index for image_index in image_indices]
+                        key = build_cache.key(image_paths, ktx2_settings)
+                        if build_cache.is_fresh(ktx2_path, key):
+                            skipped_batches += 1
+                            progress_bar.update(1)
+                            continue
+                        build_cache.invalidate(ktx2_path)
+                        threads = batch_threads[batch_index % concurrent_batches]
+                        if threads > 1:
+                            thread_option = f"-max_threads {threads}"
+                        else:
+                            thread_option = "-no_multithreading"
+                        images_pattern = config["ImagesPath"]
+                        prepare = None
+                        if counter is not None:
+                            # basisu reads stamped copies, numbered like the sources, from a directory of this batch
+                            batch_directory = os.path.join(stamped_directory, "%07u" % batch_index)
+                            images_pattern = os.path.join(batch_directory, STAMPED_IMAGE_PATTERN)
+                            prepare = lambda image_indices=image_indices, batch_directory=batch_directory, threads=threads: stamped_images(
+                                config,
+                                counter,
+                                image_indices,
+                                batch_directory,
+                                threads,
+                                STAMPING_MAX_BYTES // concurrent_batches,
+                            )
+                        command = f'{config["basisu"]} -ktx2 -tex_type video {thread_option} -multifile_printf "{images_pattern}" -multifile_num {config["KTX2_BATCH_SIZE"]} -multifile_first {current_file_index} -y_flip -output_file "{ktx2_path}"'
+                        input_bytes = sum(os.path.getsize(path) for path in image_paths)
+                        on_success = lambda batch_index, ktx2_path=ktx2_path, key=key, input_bytes=input_bytes: on_segment_compressed(batch_index, ktx2_path, key, input_bytes)
+                        if not pool.submit(batch_index, command, on_success, prepare):
+                            break
+            finally:
+                build_cache.save()
+        progress_bar.close()
+        if skipped_batches:
+            print(f"💡 Skipped {skipped_batches} up to date image batches")
+            telemetry.record_skipped("basisu", skipped_batches)
+
+        failure = pool.first_failure()
+        if failure:
+            batch_index, command, rc = failure
+            current_file_index = batch_starts[batch_index]
+            print(
+                f'Failed to compress images with indices: [{current_file_index}, {current_file_index + config["KTX2_BATCH_SIZE"]}]'
+            )
+            print("Command: ", command)
+            exit(1)
+
         config["KTX2FilesPath"] = os.path.join(
             config["OutputDirectory"], "KTX2", "texture_[#######].ktx2"
         )
@@ -304,9 +918,10 @@ def main():
     if config["KTX2FilesPath"]:
         print("✅ Obtained KTX2 files")
 
-    uvol_durations, geometry_frame_count, texture_segment_count = check_total_frames(
-        config
-    )
+    with telemetry.stage("validation"):
+        uvol_durations, geometry_frame_count, texture_segment_count = check_total_frames(
+            config, jobs
+        )
 
     manifestData = {
         "version": "v2",
@@ -327,10 +942,24 @@ def main():
         }
     }
 
+    with telemetry.stage("packing"):
+        if config.get("PACK_GEOMETRY", False):
+            manifestData["geometry"]["packed"] = pack_sequence(
+                config, build_cache, config["DRACOFilesPath"], "geometry"
+            )
+        if config.get("CHUNK_GEOMETRY", False):
+            manifestData["geometry"]["chunks"] = chunk_geometry(config, build_cache)
+        if config.get("PACK_TEXTURES", False):
+            manifestData["texture"]["targets"][0]["packed"] = pack_sequence(
+                config, build_cache, config["KTX2FilesPath"], "texture"
+            )
+        build_cache.save()
+
     # if audio duration is compatible with frames and frame rates
     if config.get("AudioURL", None):
-        with audioread.audio_open(config["AudioURL"]) as f:
-            audio_duration = f.duration  # in seconds
+        with telemetry.stage("audio"):
+            with audioread.audio_open(config["AudioURL"]) as f:
+                audio_duration = f.duration  # in seconds
         if (
             uvol_durations["geometry"] == audio_duration
             and uvol_durations["texture"] == audio_duration
@@ -361,6 +990,18 @@ def main():
     with open(manifest_path, "w") as f:
         json.dump(manifestData, f)
     print(f"✅ Written Manifest file: {manifest_path}.")
+
+    report_path = os.path.join(config["OutputDirectory"], "uvol-report.json")
+    telemetry.write(
+        report_path,
+        dict(
+            draco_settings(config),
+            JOBS=jobs,
+            ABC_EXPORT_FORMAT=config.get("ABC_EXPORT_FORMAT", "obj") if config.get("ABCFilePath") else None,
+            KTX2_BATCH_SIZE=config["KTX2_BATCH_SIZE"],
+        ),
+    )
+    print(f"✅ Written encode report: {report_path}.")
     print(
         f"💡 Tip: If you're moving the manifest file, move the DRACO and KTX2 directories along with it, because, they're relative paths"
     )
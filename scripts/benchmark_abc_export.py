@@ -0,0 +1,100 @@
+"""
+Compares the ABC extraction paths of Encoder.py.
+
+Every format in --formats exports the first --frames frames of `ABCFilePath`
+and compresses them with draco_encoder one frame at a time. The report shows
+frames per second for each step and the bytes written.
+
+Usage: python3 scripts/benchmark_abc_export.py project-config.json --frames 100
+"""
+import argparse
+import os
+import shlex
+import subprocess
+import tempfile
+import time
+
+import commentjson as json
+from tqdm import tqdm
+
+from Encoder import check_executables, draco_command, export_abc_frames, import_abc
+
+
+def benchmark_format(bpy, config, frame_start, frame_end, export_format):
+    with tempfile.TemporaryDirectory() as output_directory:
+        config = dict(config, OutputDirectory=output_directory)
+        os.makedirs(os.path.join(output_directory, export_format.upper()))
+        os.makedirs(os.path.join(output_directory, "DRC"))
+
+        progress_bar = tqdm(total=frame_end - frame_start + 1, leave=False)
+        frames = []
+        start = time.perf_counter()
+        for mesh_path, drc_path in export_abc_frames(
+            bpy, config, frame_start, frame_end, progress_bar, export_format
+        ):
+            frames.append((mesh_path, drc_path))
+            progress_bar.update(1)
+        export_seconds = time.perf_counter() - start
+        progress_bar.close()
+
+        start = time.perf_counter()
+        for mesh_path, drc_path in frames:
+            command = draco_command(config, mesh_path, drc_path)
+            rc = subprocess.call(shlex.split(command), stdout=subprocess.DEVNULL)
+            if rc:
+                print(f"❌ {export_format}: draco_encoder failed on {mesh_path}")
+                print("Command: ", command)
+                return None
+        compress_seconds = time.perf_counter() - start
+
+        return {
+            "format": export_format,
+            "frames": len(frames),
+            "export_fps": len(frames) / export_seconds,
+            "compress_fps": len(frames) / compress_seconds,
+            "total_fps": len(frames) / (export_seconds + compress_seconds),
+            "intermediate_bytes": sum(os.path.getsize(path) for path, _ in frames),
+            "drc_bytes": sum(os.path.getsize(path) for _, path in frames),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares OBJ and binary ABC extraction paths of the Encoder"
+    )
+    parser.add_argument("config", help="path to project-config.json with ABCFilePath")
+    parser.add_argument(
+        "--frames", type=int, default=100, help="number of frames to export"
+    )
+    parser.add_argument(
+        "--formats", nargs="+", default=["obj", "glb"], choices=["obj", "glb", "ply"]
+    )
+    arguments = parser.parse_args()
+
+    with open(arguments.config) as f:
+        config = json.load(f)
+    check_executables(config)
+
+    import bpy
+
+    frame_start, frame_end = import_abc(bpy, config["ABCFilePath"])
+    frame_end = min(frame_end, frame_start + arguments.frames - 1)
+
+    results = []
+    for export_format in arguments.formats:
+        result = benchmark_format(bpy, config, frame_start, frame_end, export_format)
+        if result:
+            results.append(result)
+
+    print(
+        f'{"format":<8}{"export fps":>12}{"draco fps":>12}{"total fps":>12}{"intermediate MB":>18}{"DRC MB":>10}'
+    )
+    for result in results:
+        print(
+            f'{result["format"]:<8}{result["export_fps"]:>12.2f}{result["compress_fps"]:>12.2f}{result["total_fps"]:>12.2f}'
+            f'{result["intermediate_bytes"] / 1e6:>18.2f}{result["drc_bytes"] / 1e6:>10.2f}'
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """
+    On-disk record of which inputs and settings produced each output file.
+
+    Outputs are keyed by their path relative to the output directory. A key is a
+    hash of the input file contents plus the encoder settings, so an output is
+    only rebuilt when one of its inputs or settings changed, or when the output
+    itself is missing. Input hashes are remembered together with the size and
+    modification time of the input, so unchanged inputs are not re-read.
+    """
+
+    FILE_NAME = ".uvol-build-cache.json"
+    VERSION = 1
+    SAVE_INTERVAL = 64
+
+    def __init__(self, output_directory, rebuild=False):
+        self.output_directory = output_directory
+        self.path = os.path.join(output_directory, self.FILE_NAME)
+        self.outputs = {}
+        self.inputs = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._unsaved = 0
+
+        # when rebuilding, previous outputs are not trusted but get recorded again
+        if not rebuild and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                print(f"⚠️ Ignoring unreadable build cache: {self.path}")
+                return
+            if data.get("version") == self.VERSION:
+                self.outputs = data.get("outputs", {})
+                self.inputs = data.get("inputs", {})
+
+    def input_hash(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            entry = self.inputs.get(path)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hash_file(path)
+        with self._lock:
+            self.inputs[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def key(self, input_paths, settings):
+        digest = hashlib.sha256()
+        for path in input_paths:
+            digest.update(self.input_hash(path).encode())
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def is_fresh(self, output_path, key):
+        with self._lock:
+            cached_key = self.outputs.get(self._relative(output_path))
+        return cached_key == key and os.path.exists(output_path)
+
+    def invalidate(self, output_path):
+        with self._lock:
+            self.outputs.pop(self._relative(output_path), None)
+
+    def update(self, output_path, key):
+        with self._lock:
+            self.outputs[self._relative(output_path)] = key
+            self._unsaved += 1
+            save = self._unsaved >= self.SAVE_INTERVAL
+        if save:
+            self.save()
+
+    def save(self):
+        with self._save_lock:
+            with self._lock:
+                data = {
+                    "version": self.VERSION,
+                    "outputs": dict(self.outputs),
+                    "inputs": dict(self.inputs),
+                }
+                self._unsaved = 0
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+
+    def _relative(self, output_path):
+        return os.path.relpath(output_path, self.output_directory)
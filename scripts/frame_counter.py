@@ -0,0 +1,110 @@
+import struct
+
+import cv2
+import numpy as np
+
+
+class FrameCounter:
+    """
+    Binary frame counter at the bottom left of a texture: `bits` blocks of
+    `window_size` pixels, least significant bit first, white for 1 and black
+    for 0, over the last window_size + 1 rows. With the defaults this is the
+    bar example/texture_encoder.py used to draw one cv2.rectangle per bit.
+    """
+
+    def __init__(self, bits=16, window_size=8):
+        self.bits = bits
+        self.window_size = window_size
+        self.width = bits * window_size + 1
+        self.height = window_size + 1
+        # the bit shown by every column of the bar (the first column belongs to bit 0)
+        self.column_bits = np.maximum(np.arange(self.width) - 1, 0) // window_size
+
+    def region(self, img):
+        # view of the pixels the counter is drawn in
+        height = img.shape[0]
+        return img[max(height - self.height, 0):height, 0:self.width]
+
+    def bit_row(self, frame_number):
+        # one row of the bar as 0/1 values
+        if frame_number < 0 or frame_number >= (1 << self.bits):
+            raise ValueError(f"Frame {frame_number} does not fit in {self.bits} bits")
+        return (frame_number >> self.column_bits) & 1
+
+    def row(self, frame_number):
+        # one row of the bar as 0/255 pixel values
+        return (self.bit_row(frame_number) * 255).astype(np.uint8)
+
+    def stamp(self, img, frame_number):
+        # draws the whole bar with a single slice assignment, in place. 16 bit images get 16 bit white, and the alpha
+        # channel of BGRA images is made opaque under the bar
+        region = self.region(img)
+        white = np.iinfo(img.dtype).max if np.issubdtype(img.dtype, np.integer) else 1
+        row = (self.bit_row(frame_number)[:region.shape[1]] * white).astype(img.dtype)
+        if img.ndim == 3 and img.shape[2] == 4:
+            region[..., :3] = row.reshape(1, -1, 1)
+            region[..., 3] = white
+        else:
+            region[...] = row.reshape((1, -1) + (1,) * (img.ndim - 2))
+        return img
+
+    def has_stamp(self, img, frame_number, tolerance=0):
+        # whether the bar of img reads frame_number, pixel for pixel (up to tolerance)
+        region = self.region(img)
+        if region.size == 0:
+            return False
+        expected = self.row(frame_number)[:region.shape[1]].reshape((1, -1) + (1,) * (img.ndim - 2))
+        return int(np.abs(region.astype(np.int16) - expected).max()) <= tolerance
+
+    def decode(self, images):
+        """
+        Reads the frame numbers of a batch of same size images, given as a
+        (N, height, width[, channels]) array or a list of images. Every block
+        is averaged over its inner pixels, so light compression artifacts at
+        the block edges don't flip bits. Returns an int64 array of N numbers.
+        """
+        images = np.asarray(images)
+        if images.ndim == 3:
+            images = images[..., np.newaxis]
+        count, height, width, channels = images.shape
+        if height < self.height or width < self.width:
+            raise ValueError("Images are smaller than the frame counter")
+        size = self.window_size
+        bar = images[:, height - self.height:height, 1:self.width]
+        blocks = bar.reshape(count, self.height, self.bits, size, channels)
+        margin = size // 4
+        inner = blocks[:, margin:self.height - margin, :, margin:size - margin]
+        levels = inner.mean(axis=(1, 3, 4))
+        return ((levels > 127.5).astype(np.int64) << np.arange(self.bits)).sum(axis=1)
+
+
+def write_tga(path, img):
+    """
+    Writes an 8 bit grayscale, BGR or BGRA image as an uncompressed TGA. The
+    pixels are written as they are, bottom row first, so this costs little
+    more than copying the image to disk.
+    """
+    height, width = img.shape[:2]
+    channels = 1 if img.ndim == 2 else img.shape[2]
+    if img.dtype != np.uint8 or channels not in (1, 3, 4):
+        raise ValueError(f"Can't write a {channels} channel {img.dtype} image as TGA")
+    image_type = 3 if channels == 1 else 2
+    alpha_bits = 8 if channels == 4 else 0
+    header = struct.pack("<BBBHHBHHHHBB", 0, 0, image_type, 0, 0, 0, 0, 0, width, height, 8 * channels, alpha_bits)
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(np.ascontiguousarray(img[::-1]).data)
+
+
+def read_texture(path):
+    """
+    Decodes an image to stamp and hand to basisu as an 8 bit grayscale, BGR
+    or BGRA array. The alpha channel is kept, and 16 bit images are reduced
+    to 8 bits like basisu does when it reads them.
+    """
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise IOError(f"Could not read {path}")
+    if img.dtype == np.uint16:
+        img = (img >> 8).astype(np.uint8)
+    return img
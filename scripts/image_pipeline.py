@@ -0,0 +1,123 @@
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def payload_size(value):
+    # bytes held by a decoded image (or any buffer) travelling through the pipeline
+    if value is None:
+        return 0
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return nbytes
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+class ImagePipeline:
+    """
+    Streams items through three overlapping stages:
+
+    - `read(item)` runs on `readers` threads, up to `prefetch` items ahead of
+      the item being processed. It usually loads and decodes an image.
+    - `process(item, image)` runs on the thread iterating `run()`, in item
+      order. When it returns None nothing is written, and the item comes
+      out of `run()` with a None result.
+    - `write(item, image)` runs on `writers` threads, so encoding and saving
+      an image overlaps with reading and processing the next ones.
+
+    Decoded images are the bulk of the memory used, so the pipeline also
+    keeps the bytes in flight (images read but not yet processed, and
+    images waiting to be written) under `max_bytes`. Images that haven't
+    been read yet are counted at the average size of the images read so
+    far. At least one item is always let through, however large.
+
+    cv2.imread, cv2.imwrite and cv2.imencode release the GIL, so the
+    threads decode and encode in parallel.
+    """
+
+    def __init__(self, read, process=None, write=None, readers=4, writers=2, prefetch=8, max_bytes=256 << 20):
+        self.read = read
+        self.process = process
+        self.write = write
+        self.readers = max(1, readers or 1)
+        self.writers = max(1, writers or 1)
+        self.prefetch = max(1, prefetch)
+        self.max_bytes = max_bytes
+        self.peak_bytes = 0
+        self._read_bytes = 0
+        self._read_count = 0
+
+    def _estimate(self):
+        # expected size of an image that is still being read, None until an image has been read
+        if not self._read_count:
+            return None
+        return self._read_bytes // self._read_count
+
+    def run(self, items):
+        """
+        Yields `(item, result)` in the order of `items`, once each item has
+        been processed and written. `result` is what `write` returned, or
+        the processed image when there is no writer. Errors raised by a stage
+        are raised here, at the item that failed.
+        """
+        items = iter(items)
+        reads = collections.deque()
+        writes = collections.deque()
+        write_bytes = 0
+        exhausted = False
+        with ThreadPoolExecutor(self.readers) as read_pool, ThreadPoolExecutor(self.writers) as write_pool:
+            while True:
+                # hand back the items that have been written, in order
+                while writes and writes[0][1].done():
+                    item, future, size = writes.popleft()
+                    write_bytes -= size
+                    yield item, future.result()
+
+                # keep the readers busy while the prefetch and memory budget allow it
+                while not exhausted and len(reads) < self.prefetch:
+                    estimate = self._estimate()
+                    if reads and estimate is None:
+                        break
+                    in_flight = (estimate or 0) * (len(reads) + 1) + write_bytes
+                    if (reads or writes) and in_flight > self.max_bytes:
+                        break
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    reads.append((item, read_pool.submit(self.read, item)))
+
+                if not reads:
+                    if not writes:
+                        return
+                    item, future, size = writes.popleft()
+                    write_bytes -= size
+                    yield item, future.result()
+                    continue
+
+                item, future = reads.popleft()
+                image = future.result()
+                self._read_bytes += payload_size(image)
+                self._read_count += 1
+
+                if self.process is not None:
+                    image = self.process(item, image)
+                if image is None or self.write is None:
+                    # nothing to write, but the item still comes out after the ones before it
+                    done = Future()
+                    done.set_result(image)
+                    writes.append((item, done, 0))
+                    continue
+
+                # wait for older writes while the finished images don't fit in the budget
+                size = payload_size(image)
+                while writes and write_bytes + size > self.max_bytes:
+                    pending, pending_future, pending_size = writes.popleft()
+                    write_bytes -= pending_size
+                    yield pending, pending_future.result()
+                writes.append((item, write_pool.submit(self.write, item, image), size))
+                write_bytes += size
+                self.peak_bytes = max(self.peak_bytes, write_bytes + (self._estimate() or 0) * len(reads))
@@ -0,0 +1,126 @@
+import collections
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+# https://registry.khronos.org/KTX/specs/2.0/ktxspec.v2.html#_file_structure
+IDENTIFIER = b"\xabKTX 20\xbb\r\n\x1a\n"
+# identifier, 9 uint32 header fields, 4 uint32 + 2 uint64 index fields
+HEADER = struct.Struct("<12s9I4I2Q")
+# byteOffset, byteLength, uncompressedByteLength
+LEVEL = struct.Struct("<3Q")
+
+SUPERCOMPRESSION_SCHEMES = {0: "none", 1: "BasisLZ", 2: "Zstandard", 3: "ZLIB"}
+
+Level = collections.namedtuple(
+    "Level", ["byte_offset", "byte_length", "uncompressed_byte_length"]
+)
+
+
+class KTX2Error(ValueError):
+    pass
+
+
+class KTX2Header(
+    collections.namedtuple(
+        "KTX2Header",
+        [
+            "path",
+            "vk_format",
+            "pixel_width",
+            "pixel_height",
+            "pixel_depth",
+            "layer_count",
+            "face_count",
+            "supercompression_scheme",
+            "levels",
+            "file_size",
+        ],
+    )
+):
+    @property
+    def frame_count(self):
+        # a layerCount of 0 means the file is not an array texture
+        return max(self.layer_count, 1)
+
+    @property
+    def supercompression(self):
+        return SUPERCOMPRESSION_SCHEMES.get(
+            self.supercompression_scheme, str(self.supercompression_scheme)
+        )
+
+
+def read_header(path):
+    """
+    Reads the fixed header and the level index of a KTX2 file, without reading
+    any image data. Raises KTX2Error if the file is not a valid KTX2 file or
+    if a level lies outside of it.
+    """
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        data = f.read(HEADER.size)
+        if len(data) < HEADER.size:
+            raise KTX2Error(f"{path}: truncated header")
+        (
+            identifier,
+            vk_format,
+            _type_size,
+            pixel_width,
+            pixel_height,
+            pixel_depth,
+            layer_count,
+            face_count,
+            level_count,
+            supercompression_scheme,
+            *_index,
+        ) = HEADER.unpack(data)
+        if identifier != IDENTIFIER:
+            raise KTX2Error(f"{path}: not a KTX2 file")
+
+        # a levelCount of 0 asks the loader to generate mipmaps from one level
+        level_count = max(level_count, 1)
+        if HEADER.size + level_count * LEVEL.size > file_size:
+            raise KTX2Error(f"{path}: truncated level index")
+        level_data = f.read(level_count * LEVEL.size)
+
+    levels = [Level(*fields) for fields in LEVEL.iter_unpack(level_data)]
+    for level_number, level in enumerate(levels):
+        if level.byte_offset + level.byte_length > file_size:
+            raise KTX2Error(f"{path}: level {level_number} lies past the end of file")
+
+    return KTX2Header(
+        path,
+        vk_format,
+        pixel_width,
+        pixel_height,
+        pixel_depth,
+        layer_count,
+        face_count,
+        supercompression_scheme,
+        levels,
+        file_size,
+    )
+
+
+def read_headers(paths, jobs=None):
+    """
+    Reads the headers of all `paths` in parallel. Returns (headers, errors),
+    where `headers` holds the header of every valid file in the order of
+    `paths` and `errors` holds a message for every invalid one.
+    """
+
+    def read(path):
+        try:
+            return read_header(path), None
+        except (OSError, KTX2Error) as error:
+            return None, str(error)
+
+    headers = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for header, error in executor.map(read, paths):
+            if error is None:
+                headers.append(header)
+            else:
+                errors.append(error)
+    return headers, errors
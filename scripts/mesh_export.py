@@ -0,0 +1,245 @@
+import json
+import struct
+
+import numpy as np
+
+# Blender is Z-up, while the OBJ exporter writes Y-up (forward -Z) by default.
+# Meshes written here use the same convention, so both paths give the same DRC.
+AXIS_CONVERSION = np.array(
+    [[1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, -1.0, 0.0]], dtype=np.float32
+)
+
+GLB_MAGIC = 0x46546C67
+GLB_JSON_CHUNK = 0x4E4F534A
+GLB_BIN_CHUNK = 0x004E4942
+GL_FLOAT = 5126
+GL_UNSIGNED_INT = 5125
+GL_ARRAY_BUFFER = 34962
+GL_ELEMENT_ARRAY_BUFFER = 34963
+
+
+def _loop_normals(mesh, loop_count):
+    normals = np.empty(loop_count * 3, dtype=np.float32)
+    if hasattr(mesh, "corner_normals"):
+        # Blender >= 4.1
+        mesh.corner_normals.foreach_get("vector", normals)
+    else:
+        mesh.calc_normals_split()
+        mesh.loops.foreach_get("normal", normals)
+    return normals.reshape(-1, 3)
+
+
+def extract_object_arrays(obj, depsgraph):
+    """
+    Reads the evaluated mesh of `obj` with bulk `foreach_get` calls.
+
+    Blender stores UVs and split normals per face corner (loop), so vertices
+    are split wherever the corners of one vertex disagree, the same way the OBJ
+    exporter does. Returns world space (positions, normals, uvs, triangles)
+    where `uvs` is None if the mesh has no UV layer.
+    """
+    evaluated = obj.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get("vertex_index", loop_vertices)
+        triangle_loops = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get("loops", triangle_loops)
+        normals = _loop_normals(mesh, len(mesh.loops))
+
+        uvs = None
+        if mesh.uv_layers.active is not None:
+            uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+            mesh.uv_layers.active.data.foreach_get("uv", uvs)
+            uvs = uvs.reshape(-1, 2)
+    finally:
+        evaluated.to_mesh_clear()
+
+    matrix = np.array(obj.matrix_world, dtype=np.float32)
+    positions = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    positions = positions @ AXIS_CONVERSION.T
+    normal_matrix = np.linalg.inv(matrix[:3, :3]).T
+    normals = normals @ normal_matrix.T @ AXIS_CONVERSION.T
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = normals / np.where(lengths > 0, lengths, 1)
+
+    corner_fields = [("vertex", "<i4"), ("normal", "<f4", 3)]
+    if uvs is not None:
+        corner_fields.append(("uv", "<f4", 2))
+    corners = np.empty(len(loop_vertices), dtype=corner_fields)
+    corners["vertex"] = loop_vertices
+    corners["normal"] = normals
+    if uvs is not None:
+        corners["uv"] = uvs
+
+    unique_corners, first_loops, loop_to_vertex = np.unique(
+        corners.view(np.dtype((np.void, corners.dtype.itemsize))),
+        return_index=True,
+        return_inverse=True,
+    )
+    triangles = loop_to_vertex.reshape(-1)[triangle_loops].reshape(-1, 3)
+
+    return (
+        np.ascontiguousarray(positions[loop_vertices[first_loops]], dtype=np.float32),
+        np.ascontiguousarray(normals[first_loops], dtype=np.float32),
+        None if uvs is None else np.ascontiguousarray(uvs[first_loops]),
+        triangles.astype(np.uint32),
+    )
+
+
+def extract_mesh_arrays(objects, depsgraph):
+    """
+    Merges the evaluated meshes of `objects` into a single set of arrays.
+    See `extract_object_arrays`.
+    """
+    parts = [
+        extract_object_arrays(obj, depsgraph) for obj in objects if obj.type == "MESH"
+    ]
+    if not parts:
+        raise ValueError("No mesh objects to export")
+
+    offsets = np.cumsum([0] + [len(part[0]) for part in parts[:-1]])
+    positions = np.concatenate([part[0] for part in parts])
+    normals = np.concatenate([part[1] for part in parts])
+    uvs = None
+    if all(part[2] is not None for part in parts):
+        uvs = np.concatenate([part[2] for part in parts])
+    triangles = np.concatenate(
+        [part[3] + np.uint32(offset) for part, offset in zip(parts, offsets)]
+    )
+    return positions, normals, uvs, triangles
+
+
+def write_glb(path, positions, normals, uvs, triangles):
+    """
+    Writes a minimal binary glTF with a single triangle primitive.
+    Returns the number of bytes written.
+    """
+    attributes = [("POSITION", positions, "VEC3"), ("NORMAL", normals, "VEC3")]
+    if uvs is not None:
+        # glTF UVs have their origin at the top left, draco flips them back on import
+        flipped = uvs.copy()
+        flipped[:, 1] = 1.0 - flipped[:, 1]
+        attributes.append(("TEXCOORD_0", flipped, "VEC2"))
+
+    binary = bytearray()
+    buffer_views = []
+    accessors = []
+    primitive = {"attributes": {}, "mode": 4}
+
+    for name, data, accessor_type in attributes:
+        data = np.ascontiguousarray(data, dtype="<f4")
+        buffer_views.append(
+            {
+                "buffer": 0,
+                "byteOffset": len(binary),
+                "byteLength": data.nbytes,
+                "target": GL_ARRAY_BUFFER,
+            }
+        )
+        accessor = {
+            "bufferView": len(buffer_views) - 1,
+            "componentType": GL_FLOAT,
+            "count": len(data),
+            "type": accessor_type,
+        }
+        if name == "POSITION":
+            accessor["min"] = data.min(axis=0).tolist()
+            accessor["max"] = data.max(axis=0).tolist()
+        accessors.append(accessor)
+        primitive["attributes"][name] = len(accessors) - 1
+        binary += data.tobytes()
+
+    indices = np.ascontiguousarray(triangles, dtype="<u4").reshape(-1)
+    buffer_views.append(
+        {
+            "buffer": 0,
+            "byteOffset": len(binary),
+            "byteLength": indices.nbytes,
+            "target": GL_ELEMENT_ARRAY_BUFFER,
+        }
+    )
+    accessors.append(
+        {
+            "bufferView": len(buffer_views) - 1,
+            "componentType": GL_UNSIGNED_INT,
+            "count": len(indices),
+            "type": "SCALAR",
+        }
+    )
+    primitive["indices"] = len(accessors) - 1
+    binary += indices.tobytes()
+    binary += b"\0" * (-len(binary) % 4)
+
+    document = {
+        "asset": {"version": "2.0", "generator": "UVOL Encoder"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0}],
+        "meshes": [{"primitives": [primitive]}],
+        "buffers": [{"byteLength": len(binary)}],
+        "bufferViews": buffer_views,
+        "accessors": accessors,
+    }
+    json_chunk = json.dumps(document, separators=(",", ":")).encode()
+    json_chunk += b" " * (-len(json_chunk) % 4)
+
+    total_length = 12 + 8 + len(json_chunk) + 8 + len(binary)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<III", GLB_MAGIC, 2, total_length))
+        f.write(struct.pack("<II", len(json_chunk), GLB_JSON_CHUNK))
+        f.write(json_chunk)
+        f.write(struct.pack("<II", len(binary), GLB_BIN_CHUNK))
+        f.write(binary)
+    return total_length
+
+
+def write_ply(path, positions, normals, uvs, triangles):
+    """
+    Writes a binary little-endian PLY with positions, normals and triangles.
+    draco_encoder's PLY reader ignores texture coordinates, so `uvs` is not
+    written. Returns the number of bytes written.
+    """
+    vertices = np.empty(
+        len(positions),
+        dtype=[
+            ("x", "<f4"), ("y", "<f4"), ("z", "<f4"),
+            ("nx", "<f4"), ("ny", "<f4"), ("nz", "<f4"),
+        ],
+    )
+    vertices["x"], vertices["y"], vertices["z"] = positions.T
+    vertices["nx"], vertices["ny"], vertices["nz"] = normals.T
+
+    faces = np.empty(len(triangles), dtype=[("count", "u1"), ("indices", "<i4", 3)])
+    faces["count"] = 3
+    faces["indices"] = triangles
+
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        f"element vertex {len(vertices)}\n"
+        "property float x\n"
+        "property float y\n"
+        "property float z\n"
+        "property float nx\n"
+        "property float ny\n"
+        "property float nz\n"
+        f"element face {len(faces)}\n"
+        "property list uchar int vertex_indices\n"
+        "end_header\n"
+    ).encode()
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(vertices.tobytes())
+        f.write(faces.tobytes())
+    return len(header) + vertices.nbytes + faces.nbytes
+
+
+WRITERS = {
+    "glb": write_glb,
+    "ply": write_ply,
+}
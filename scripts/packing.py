@@ -0,0 +1,167 @@
+import os
+import shutil
+import struct
+
+# Geometry chunk header: magic, version, frame count, index of the first frame
+# in the sequence, then frame count + 1 offsets (from the start of the chunk)
+# so that frame i spans [offsets[i], offsets[i + 1]).
+CHUNK_MAGIC = b"UVGC"
+CHUNK_VERSION = 1
+CHUNK_HEADER = struct.Struct("<4s3I")
+CHUNK_OFFSET = struct.Struct("<I")
+
+
+def plan_blobs(paths, max_blob_size):
+    """
+    Splits `paths` into consecutive groups whose total size stays below
+    `max_blob_size` bytes (a single larger file gets a group of its own).
+    Returns a list of blobs, each a list of (path, offset, length).
+    """
+    blobs = []
+    current = []
+    offset = 0
+    for path in paths:
+        length = os.path.getsize(path)
+        if current and offset + length > max_blob_size:
+            blobs.append(current)
+            current = []
+            offset = 0
+        current.append((path, offset, length))
+        offset += length
+    if current:
+        blobs.append(current)
+    return blobs
+
+
+def write_blob(blob_path, members):
+    """Concatenates the `members` of a blob into `blob_path` atomically."""
+    temp_path = blob_path + ".tmp"
+    with open(temp_path, "wb") as output:
+        for path, offset, length in members:
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, output, 1 << 20)
+            if output.tell() != offset + length:
+                raise OSError(f"{path} changed while packing it into {blob_path}")
+    os.replace(temp_path, blob_path)
+
+
+def remove_stale_outputs(pattern, first_number, build_cache=None):
+    """
+    Deletes the files named by the C style `pattern` from `first_number` on,
+    left over by an earlier run that wrote more of them, and forgets them in
+    `build_cache`. Returns the number of files removed.
+    """
+    removed = 0
+    number = first_number
+    while os.path.exists(pattern % number):
+        os.remove(pattern % number)
+        if build_cache is not None:
+            build_cache.invalidate(pattern % number)
+        removed += 1
+        number += 1
+    return removed
+
+
+def pack_files(paths, blob_pattern, max_blob_size, build_cache=None, settings=None):
+    """
+    Packs `paths`, in order, into blobs named by the C style `blob_pattern`.
+    Blobs that are up to date in `build_cache` are not written again, and
+    blobs left over by a previous run with more blobs are deleted.
+
+    Returns (blob_paths, entries) where `entries` has one
+    {"blob", "offset", "length"} item per input path.
+    """
+    blob_paths = []
+    entries = []
+    for blob_number, members in enumerate(plan_blobs(paths, max_blob_size)):
+        blob_path = blob_pattern % blob_number
+        blob_paths.append(blob_path)
+        entries.extend(
+            {"blob": blob_number, "offset": offset, "length": length}
+            for _path, offset, length in members
+        )
+
+        key = None
+        if build_cache is not None:
+            key = build_cache.key([path for path, _, _ in members], settings or {})
+            if build_cache.is_fresh(blob_path, key):
+                continue
+            build_cache.invalidate(blob_path)
+        write_blob(blob_path, members)
+        if build_cache is not None:
+            build_cache.update(blob_path, key)
+    remove_stale_outputs(blob_pattern, len(blob_paths), build_cache)
+    return blob_paths, entries
+
+
+def write_chunk(chunk_path, frame_paths, first_frame):
+    """
+    Writes `frame_paths` into a single chunk file, atomically.
+    Returns the number of bytes written.
+    """
+    lengths = [os.path.getsize(path) for path in frame_paths]
+    offset = CHUNK_HEADER.size + CHUNK_OFFSET.size * (len(frame_paths) + 1)
+    offsets = [offset]
+    for length in lengths:
+        offset += length
+        offsets.append(offset)
+    if offset > 0xFFFFFFFF:
+        raise ValueError(f"{chunk_path} would be larger than 4 GiB")
+
+    temp_path = chunk_path + ".tmp"
+    with open(temp_path, "wb") as output:
+        output.write(
+            CHUNK_HEADER.pack(CHUNK_MAGIC, CHUNK_VERSION, len(frame_paths), first_frame)
+        )
+        output.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        for path in frame_paths:
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, output, 1 << 20)
+        if output.tell() != offset:
+            raise OSError(f"Frames changed while writing {chunk_path}")
+    os.replace(temp_path, chunk_path)
+    return offset
+
+
+def read_chunk_header(chunk_path):
+    """
+    Returns (first_frame, offsets) of a chunk written by `write_chunk`.
+    Raises ValueError if the file is not a valid chunk.
+    """
+    with open(chunk_path, "rb") as f:
+        data = f.read(CHUNK_HEADER.size)
+        if len(data) < CHUNK_HEADER.size:
+            raise ValueError(f"{chunk_path}: truncated chunk header")
+        magic, version, frame_count, first_frame = CHUNK_HEADER.unpack(data)
+        if magic != CHUNK_MAGIC or version != CHUNK_VERSION:
+            raise ValueError(f"{chunk_path}: not a version {CHUNK_VERSION} geometry chunk")
+        data = f.read(CHUNK_OFFSET.size * (frame_count + 1))
+        if len(data) < CHUNK_OFFSET.size * (frame_count + 1):
+            raise ValueError(f"{chunk_path}: truncated frame offsets")
+    return first_frame, list(struct.unpack(f"<{frame_count + 1}I", data))
+
+
+def chunk_files(paths, chunk_size, chunk_pattern, build_cache=None, settings=None):
+    """
+    Groups `paths`, in order, into chunks of `chunk_size` frames named by the
+    C style `chunk_pattern` (the last chunk may be shorter). Chunks that are up
+    to date in `build_cache` are not written again, and chunks left over by a
+    previous run with more chunks are deleted. Returns the chunk paths.
+    """
+    chunk_paths = []
+    for chunk_number, first_frame in enumerate(range(0, len(paths), chunk_size)):
+        chunk_path = chunk_pattern % chunk_number
+        chunk_paths.append(chunk_path)
+        members = paths[first_frame : first_frame + chunk_size]
+
+        key = None
+        if build_cache is not None:
+            key = build_cache.key(members, settings or {})
+            if build_cache.is_fresh(chunk_path, key):
+                continue
+            build_cache.invalidate(chunk_path)
+        write_chunk(chunk_path, members, first_frame)
+        if build_cache is not None:
+            build_cache.update(chunk_path, key)
+    remove_stale_outputs(chunk_pattern, len(chunk_paths), build_cache)
+    return chunk_paths
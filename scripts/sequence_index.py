@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import re
+
+
+def compile_pattern(pattern):
+    """
+    Compiles a file name pattern such as `frame_[#######].obj` (or
+    `frame_#######.obj`) into a regex capturing the frame number.
+
+    The pound run sets the minimum padding: wider numbers still match, like
+    printf's `%07u` writes them once a sequence grows past the padding.
+    """
+    match = re.search(r"\[?(#+)\]?", pattern)
+    if match is None:
+        raise ValueError(f"Pattern has no frame number placeholder: {pattern}")
+    pad_length = len(match.group(1))
+    return re.compile(
+        re.escape(pattern[: match.start()])
+        + f"(\\d{{{pad_length},}})"
+        + re.escape(pattern[match.end() :])
+        + "$"
+    )
+
+
+def index_sidecar_path(directory, path_pattern):
+    """Sidecar file in `directory` for the index of `path_pattern`."""
+    digest = hashlib.sha1(os.path.abspath(path_pattern).encode()).hexdigest()
+    return os.path.join(directory, f".uvol-index-{digest[:16]}.json")
+
+
+class SequenceIndex:
+    """
+    Sorted map of frame number to file path for one file sequence.
+
+    The directory is scanned once with `os.scandir`. Frame numbers matched by
+    more than one file (eg: `frame_001.obj` and `frame_0001.obj`) are kept in
+    `duplicates`, and runs of missing frame numbers between the first and last
+    frame are reported by `gaps()`.
+    """
+
+    SIDECAR_VERSION = 1
+
+    def __init__(self, path_pattern, frames=None, duplicates=None, mtime_ns=None):
+        self.path_pattern = path_pattern
+        self.directory, self.pattern = os.path.split(path_pattern)
+        self.frames = dict(sorted((frames or {}).items()))
+        self.duplicates = duplicates or {}
+        # modification time of the directory when it was scanned
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    def scan(cls, path_pattern):
+        directory, pattern = os.path.split(path_pattern)
+        regex = compile_pattern(pattern)
+        mtime_ns = os.stat(directory or ".").st_mtime_ns
+        frames = {}
+        duplicates = {}
+        with os.scandir(directory or ".") as entries:
+            for entry in entries:
+                match = regex.match(entry.name)
+                if match is None:
+                    continue
+                frame = int(match.group(1))
+                if frame in frames:
+                    duplicates.setdefault(frame, [frames[frame]]).append(
+                        os.path.join(directory, entry.name)
+                    )
+                else:
+                    frames[frame] = os.path.join(directory, entry.name)
+        return cls(path_pattern, frames, duplicates, mtime_ns)
+
+    @classmethod
+    def load(cls, path_pattern, sidecar_path):
+        """
+        Reuses the index saved by `save` if the sequence directory has not been
+        modified since, otherwise scans the directory again.
+        """
+        directory = os.path.split(path_pattern)[0] or "."
+        try:
+            with open(sidecar_path) as f:
+                data = json.load(f)
+            mtime_ns = os.stat(directory).st_mtime_ns
+            if (
+                data.get("version") == cls.SIDECAR_VERSION
+                and data.get("pattern") == path_pattern
+                and data.get("mtime_ns") == mtime_ns
+            ):
+                return cls(
+                    path_pattern,
+                    {int(frame): path for frame, path in data["frames"].items()},
+                    {int(frame): paths for frame, paths in data["duplicates"].items()},
+                    mtime_ns,
+                )
+        except (OSError, ValueError, KeyError):
+            pass
+        return cls.scan(path_pattern)
+
+    def save(self, sidecar_path):
+        """
+        Saves the index to `sidecar_path`, which should live outside the
+        sequence directory so that writing it does not invalidate it.
+        """
+        data = {
+            "version": self.SIDECAR_VERSION,
+            "pattern": self.path_pattern,
+            "mtime_ns": self.mtime_ns,
+            "frames": self.frames,
+            "duplicates": self.duplicates,
+        }
+        temp_path = sidecar_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, sidecar_path)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        return iter(self.frames.items())
+
+    def paths(self):
+        return list(self.frames.values())
+
+    def first(self):
+        return next(iter(self.frames), None)
+
+    def last(self):
+        return list(self.frames)[-1] if self.frames else None
+
+    def gaps(self):
+        """
+        Returns the runs of missing frame numbers between the first and last
+        frame, as inclusive (first missing, last missing) pairs.
+        """
+        gaps = []
+        frames = list(self.frames)
+        for previous, current in zip(frames, frames[1:]):
+            if current - previous > 1:
+                gaps.append((previous + 1, current - 1))
+        return gaps
@@ -0,0 +1,153 @@
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+
+REPORT_VERSION = 1
+
+
+def cpu_times():
+    """
+    CPU seconds used by this process and by its waited-for child processes
+    (draco_encoder, basisu), which is where most of the encoding happens.
+    """
+    times = os.times()
+    return time.process_time(), times.children_user + times.children_system
+
+
+def percentile(sorted_values, fraction):
+    # nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Telemetry:
+    """
+    Collects per-stage timings and per-item (frame or segment) encode results
+    of one Encoder run and writes them as a JSON report.
+    """
+
+    def __init__(self, slowest_count=10):
+        self.slowest_count = slowest_count
+        self.started = time.time()
+        self.stages = {}
+        self.items = {}
+        self._lock = threading.Lock()
+        self._wall_start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measures wall and CPU time of the enclosed block under `name`."""
+        wall_start = time.perf_counter()
+        process_start, children_start = cpu_times()
+        try:
+            yield
+        finally:
+            process_end, children_end = cpu_times()
+            self.add_stage_time(
+                name,
+                time.perf_counter() - wall_start,
+                process_end - process_start,
+                children_end - children_start,
+            )
+
+    def add_stage_time(self, name, wall_seconds, process_cpu_seconds, children_cpu_seconds=0.0):
+        with self._lock:
+            stage = self.stages.setdefault(
+                name,
+                {"wall_seconds": 0.0, "process_cpu_seconds": 0.0, "children_cpu_seconds": 0.0},
+            )
+            stage["wall_seconds"] += wall_seconds
+            stage["process_cpu_seconds"] += process_cpu_seconds
+            stage["children_cpu_seconds"] += children_cpu_seconds
+
+    def timed_iterator(self, name, iterator):
+        """
+        Yields from `iterator`, counting only the time spent producing items
+        (eg: exporting ABC frames) towards stage `name`.
+        """
+        iterator = iter(iterator)
+        while True:
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_stage_time(
+                    name,
+                    time.perf_counter() - wall_start,
+                    time.thread_time() - cpu_start,
+                )
+            yield item
+
+    def record_item(self, stage, name, seconds, input_bytes, output_bytes):
+        """Records one encoded frame (or segment) of `stage`."""
+        with self._lock:
+            self.items.setdefault(stage, []).append(
+                {
+                    "name": name,
+                    "seconds": seconds,
+                    "input_bytes": input_bytes,
+                    "output_bytes": output_bytes,
+                }
+            )
+
+    def record_skipped(self, stage, count=1):
+        with self._lock:
+            stage = self.stages.setdefault(
+                stage,
+                {"wall_seconds": 0.0, "process_cpu_seconds": 0.0, "children_cpu_seconds": 0.0},
+            )
+            stage["skipped"] = stage.get("skipped", 0) + count
+
+    def summarize_items(self, items):
+        latencies = sorted(item["seconds"] for item in items)
+        input_bytes = sum(item["input_bytes"] for item in items)
+        output_bytes = sum(item["output_bytes"] for item in items)
+        return {
+            "count": len(items),
+            "latency_seconds": {
+                "mean": sum(latencies) / len(latencies),
+                "p50": percentile(latencies, 0.50),
+                "p90": percentile(latencies, 0.90),
+                "p99": percentile(latencies, 0.99),
+                "max": latencies[-1],
+            },
+            "input_bytes": {"total": input_bytes, "mean": input_bytes / len(items)},
+            "output_bytes": {"total": output_bytes, "mean": output_bytes / len(items)},
+            "compression_ratio": input_bytes / output_bytes if output_bytes else None,
+            "slowest": sorted(items, key=lambda item: item["seconds"], reverse=True)[
+                : self.slowest_count
+            ],
+        }
+
+    def report(self, settings=None):
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+            items = {name: list(stage_items) for name, stage_items in self.items.items()}
+        for stage in stages.values():
+            stage["cpu_seconds"] = stage["process_cpu_seconds"] + stage["children_cpu_seconds"]
+        return {
+            "version": REPORT_VERSION,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started)),
+            "wall_seconds": time.perf_counter() - self._wall_start,
+            "settings": settings or {},
+            "stages": stages,
+            "items": {
+                name: self.summarize_items(stage_items)
+                for name, stage_items in items.items()
+                if stage_items
+            },
+        }
+
+    def write(self, path, settings=None):
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.report(settings), f, indent=2)
+        os.replace(temp_path, path)
@@ -0,0 +1,68 @@
+import os
+import sys
+from types import SimpleNamespace
+
+from tqdm import tqdm
+
+from build_cache import BuildCache
+from Encoder import compress_mesh_frames, export_abc_frames, split_cpu_budget
+
+
+FAKE_DRACO_ENCODER = """
+import sys
+with open(sys.argv[sys.argv.index("-o") + 1], "wb") as f:
+    f.write(b"DRACO")
+"""
+
+
+def fake_bpy():
+    # the parts of bpy export_abc_frames uses. Like Blender's exporter, the
+    # OBJ export writes a .mtl file next to the OBJ unless use_materials is off
+    def export_obj(filepath, use_selection=False, use_materials=True):
+        with open(filepath, "w") as f:
+            f.write("v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n")
+        if use_materials:
+            with open(os.path.splitext(filepath)[0] + ".mtl", "w") as f:
+                f.write("newmtl Material\n")
+
+    scene = SimpleNamespace(frame_set=lambda frame: None)
+    return SimpleNamespace(
+        context=SimpleNamespace(scene=scene),
+        ops=SimpleNamespace(export_scene=SimpleNamespace(obj=export_obj)),
+    )
+
+
+def test_streamed_obj_frames_leave_no_intermediate_files(tmp_path):
+    draco_encoder = tmp_path / "draco_encoder.py"
+    draco_encoder.write_text(FAKE_DRACO_ENCODER)
+    output = tmp_path / "output"
+    os.makedirs(output / "OBJ")
+    os.makedirs(output / "DRC")
+    config = {
+        "OutputDirectory": str(output),
+        "draco_encoder": f'"{sys.executable}" "{draco_encoder}"',
+    }
+
+    frames = export_abc_frames(fake_bpy(), config, 1, 3, tqdm(disable=True))
+    compress_mesh_frames(
+        config,
+        2,
+        BuildCache(str(output)),
+        frames,
+        tqdm(disable=True),
+        queue_size=2,
+        delete_meshes=True,
+    )
+
+    assert os.listdir(output / "OBJ") == []
+    assert sorted(os.listdir(output / "DRC")) == [
+        f"frame_{frame:07}.obj.drc" for frame in (1, 2, 3)
+    ]
+
+
+def test_split_cpu_budget_gives_leftover_threads_to_first_batches():
+    assert split_cpu_budget(8, 3) == (3, [3, 3, 2])
+    assert split_cpu_budget(7, 2) == (2, [4, 3])
+    assert split_cpu_budget(6, 3) == (3, [2, 2, 2])
+    assert split_cpu_budget(2, 5) == (2, [1, 1])
+    assert split_cpu_budget(4, 0) == (1, [4])